@@ -0,0 +1,163 @@
+import asyncio, re, threading
+
+if __package__:
+    from . import cs_common
+
+class Loop:
+    """
+    Single asyncio event loop, running in its own daemon thread and shared
+    by all connections in all windows. Started lazily on first use.
+    Once stopped, stays stopped: nothing can start it again
+    """
+    def __init__(self):
+        self.loop       = None
+        self.thread     = None
+        self.lock       = threading.Lock()
+        self.stopped    = False
+        self.transports = set()
+
+    def run_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def start(self):
+        """
+        Running loop, or None if it was stopped
+        """
+        with self.lock:
+            if self.stopped:
+                return None
+            if not self.loop:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(daemon = True, target = self.run_loop, args = (self.loop, ))
+                self.thread.start()
+            return self.loop
+
+    def in_loop(self):
+        return self.thread is not None and threading.current_thread() is self.thread
+
+    def submit(self, coro):
+        """
+        Schedule coroutine on the loop. Returns concurrent.futures.Future
+        """
+        if not (loop := self.start()):
+            coro.close()
+            raise RuntimeError('Event loop is stopped')
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro, timeout = None):
+        """
+        Schedule coroutine and block current thread until it’s done.
+        Must not be called from the loop thread itself
+        """
+        return self.submit(coro).result(timeout)
+
+    def call(self, fn, *args):
+        """
+        Call fn on the loop thread. Returns False if loop was stopped
+        """
+        if loop := self.start():
+            loop.call_soon_threadsafe(fn, *args)
+            return True
+        return False
+
+    async def shutdown(self, transports):
+        for transport in transports:
+            transport.writer.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+
+    def stop(self, timeout = 1):
+        """
+        Closes all transports, cancels their read loops, then stops the loop.
+        When called outside of loop thread, waits for all that to finish
+        """
+        with self.lock:
+            loop, thread = self.loop, self.thread
+            transports = list(self.transports)
+            self.loop, self.thread = None, None
+            self.stopped = True
+            self.transports.clear()
+        if loop:
+            shutdown = asyncio.run_coroutine_threadsafe(self.shutdown(transports), loop)
+            if thread is not threading.current_thread():
+                try:
+                    shutdown.result(timeout)
+                except Exception:
+                    pass
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+loop = Loop()
+
+def enabled():
+    return bool(cs_common.setting('shared_event_loop', False))
+
+async def open_connection(addr):
+    if match := re.fullmatch(r'\s*([^:]+):(\d+)\s*', addr):
+        host, port = match.groups()
+        return await asyncio.open_connection(host, int(port))
+    else: # path == unix domain socket
+        return await asyncio.open_unix_connection(addr)
+
+class Transport:
+    """
+    Socket-like wrapper around asyncio streams. `sendall` and `close` can be
+    called from any thread, reading happens in a coroutine passed to `start`
+    """
+    def __init__(self, addr, timeout = 10):
+        self.reader, self.writer = loop.run(open_connection(addr), timeout)
+        self.task = None
+        with loop.lock:
+            loop.transports.add(self)
+
+    def start(self, read_loop):
+        """
+        Run `read_loop(reader)` coroutine on the shared loop
+        """
+        self.task = loop.submit(read_loop(self.reader))
+
+    def sendall(self, data):
+        loop.call(self.writer.write, data)
+
+    def close(self, timeout = 1):
+        """
+        Closes underlying stream. Read loop sees EOF and exits on its own.
+        When called outside of loop thread, waits for read loop to finish.
+        No-op if loop was already stopped (it closed everything itself)
+        """
+        with loop.lock:
+            loop.transports.discard(self)
+        if not loop.call(self.writer.close):
+            return
+        if self.task and not loop.in_loop():
+            try:
+                self.task.result(timeout)
+            except Exception:
+                pass
+
+async def lines(reader):
+    """
+    Async version of `cs_conn_socket_repl.lines`
+    """
+    buffer = b''
+    while True:
+        more = await reader.read(4096)
+        if more:
+            buffer += more
+        while b'\n' in buffer:
+            (line, buffer) = buffer.split(b'\n', 1)
+            yield line.decode()
+        if not more:
+            break
+    if buffer:
+        yield buffer.decode()
+
+def plugin_unloaded():
+    loop.stop()
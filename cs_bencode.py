@@ -81,6 +81,45 @@ def _read_datum(s):
         return _read_fns.get(delim, lambda s: _read_bytes(s, delim))(s)
 
 
+async def _read_int_async(s, init_data=None):
+    int_chrs = init_data or []
+    while True:
+        c = await s.read(1)
+        if not (c.isdigit() or c == b'-') or not c:
+            break
+        else:
+            int_chrs.append(c)
+    return int(b''.join(int_chrs))
+
+
+async def _read_list_async(s):
+    data = []
+    while True:
+        datum = await _read_datum_async(s)
+        if datum is None:
+            break
+        data.append(datum)
+    return data
+
+
+async def _read_datum_async(s):
+    "Same as _read_datum, but reads from asyncio.StreamReader"
+    d = await s.read(1)
+    if d == b'' or d == b'e':
+        return None
+    elif d.isdigit():
+        n = await _read_int_async(s, [d])
+        data = await s.readexactly(n)
+        return data.decode("UTF-8")
+    elif d == b'i':
+        return await _read_int_async(s)
+    elif d == b'l':
+        return await _read_list_async(s)
+    elif d == b'd':
+        i = iter(await _read_list_async(s))
+        return dict(zip(i, i))
+
+
 def _write_datum(x, out):
     if isinstance(x, (str, bytes)):
         # x = x.encode("UTF-8")
@@ -122,6 +161,15 @@ def decode_file(file):
         yield x
 
 
+async def decode_stream(reader):
+    "Async generator that yields decoded values from asyncio.StreamReader."
+    while True:
+        x = await _read_datum_async(reader)
+        if x is None:
+            break
+        yield x
+
+
 def decode(string):
     "Generator that yields decoded values from the input string."
     return decode_file(BytesIO(string.encode('utf-8')))
@@ -1,4 +1,5 @@
-import collections, math, os, re, socket, sublime, sublime_plugin, time, traceback
+import collections, hashlib, math, os, re, socket, sublime, sublime_plugin, time, traceback
+from . import cs_snapshot
 
 ns = 'clojure-sublimed'
 
@@ -77,17 +78,22 @@ def error(format, *args):
 
 class Measure:
     """
-    Measure and print (if debug) execution time of with block. Format as in `str.format`
+    Measure and print (if debug) execution time of with block. Format as in `str.format`.
+    Also prints how many Sublime API calls went through cs_snapshot and how many
+    queries it answered locally
     """
     def __init__(self, format, *args):
-        self.format = "{:.2f} ms " + format
+        self.format = "{:.2f} ms " + format + "{}"
         self.args = args
 
     def __enter__(self):
         self.time = time.time()
+        self.calls = cs_snapshot.calls.copy()
 
     def __exit__(self, exc_type, exc_value, exc_tb):
-        debug(self.format, (time.time() - self.time) * 1000, *self.args)
+        calls = cs_snapshot.calls - self.calls
+        calls = ", calls: " + ", ".join(f"{name} {count}" for name, count in sorted(calls.items())) if calls else ""
+        debug(self.format, (time.time() - self.time) * 1000, *self.args, calls)
 
 def format_time_taken(time_taken):
     """
@@ -106,6 +112,35 @@ def format_time_taken(time_taken):
             else:
                 return f"({'{:.2f}'.format(elapsed * 1000)} ms)"
 
+def format_bytes(n):
+    if n >= 1 << 30:
+        return '{:.1f} GB'.format(n / (1 << 30))
+    elif n >= 1 << 20:
+        return '{:.1f} MB'.format(n / (1 << 20))
+    elif n >= 1 << 10:
+        return '{:.0f} KB'.format(n / (1 << 10))
+    else:
+        return f'{n} B'
+
+def format_stats(stats):
+    """
+    Human-readable memory allocated and GC activity during eval, if above
+    `alloc_threshold_bytes` / `gc_threshold_ms`
+    """
+    if not stats:
+        return None
+    parts = []
+    alloc_threshold = setting("alloc_threshold_bytes")
+    if alloc_threshold != None and (alloc := stats.get('alloc')) != None and alloc >= alloc_threshold:
+        parts.append(format_bytes(alloc))
+    gc_threshold = setting("gc_threshold_ms")
+    gc_count = stats.get('gc_count') or 0
+    gc_time = stats.get('gc_time') or 0
+    if gc_threshold != None and gc_count > 0 and gc_time >= gc_threshold:
+        parts.append(f"{gc_count} GC {gc_time} ms")
+    if parts:
+        return "(" + ", ".join(parts) + ")"
+
 def regions_touch(r1, r2):
     """
     True iff regions intersect or touch
@@ -124,9 +159,40 @@ def basic_styles(view):
         p {{ margin: 0; padding: {top}px 0 {bottom}px 0; }}
     """
 
+clojure_sources = {}
+
 def clojure_source(file):
-    file = sublime.load_resource(f'Packages/{package}/src_clojure/clojure_sublimed/' + file)
-    return re.sub(r'(?m)^\s+', '', file).strip() + '\n'
+    """
+    Minified content of src_clojure/clojure_sublimed/<file>. Cached until plugin reload
+    """
+    if file not in clojure_sources:
+        source = sublime.load_resource(f'Packages/{package}/src_clojure/clojure_sublimed/' + file)
+        clojure_sources[file] = re.sub(r'(?m)^\s+', '', source).strip() + '\n'
+    return clojure_sources[file]
+
+def clojure_source_hash(*files):
+    """
+    Short content hash of several Clojure sources, used as a version to skip re-uploading them
+    """
+    return hashlib.sha1(''.join(clojure_source(file) for file in files).encode()).hexdigest()[:12]
+
+def clojure_upload(ns, files):
+    """
+    Clojure form that loads `files` unless `ns` already has a `version` var
+    matching their content hash. Evaluates to "cached" or "loaded"
+    """
+    version = clojure_source_hash(*files)
+    key = (ns, version)
+    if key not in clojure_sources:
+        loads = ' '.join(f'(load-string {clojure_string(clojure_source(file))})' for file in files)
+        clojure_sources[key] = f'''(if (= "{version}" (some-> (resolve '{ns}/version) deref)) "cached" (do {loads} (intern '{ns} 'version "{version}") "loaded"))'''
+    return clojure_sources[key]
+
+def clojure_string(s):
+    """
+    Escape Python string as Clojure string literal
+    """
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
 def active_view():
     if window := sublime.active_window():
@@ -1,9 +1,23 @@
-import os, re, sublime, sublime_plugin
-from . import cs_common, cs_eval, cs_eval_status, cs_parser, cs_warn
+import os, re, sublime, sublime_plugin, time
+from . import cs_common, cs_eval, cs_eval_status, cs_parser, cs_progress, cs_scheduler, cs_snapshot, cs_warn
 
 status_key = 'clojure-sublimed-conn'
 phases = ['🌑', '🌒', '🌓', '🌔', '🌕']
 
+progress_key = 'clojure-sublimed-eval-buffer'
+
+# Scheduler priorities, lower goes first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+def wrap_code(wrap, code, column):
+    """
+    Puts code between (prefix, suffix), returns (code, column) where column is
+    shifted so that positions inside original code are still reported correctly
+    """
+    prefix, suffix = wrap
+    return (prefix + code + suffix, column - len(prefix))
+
 def ready(window = None):
     """
     When connection is fully initialized
@@ -12,10 +26,20 @@ def ready(window = None):
     return bool(state.conn and state.conn.ready())
 
 class Connection:
+    # clojure-sublimed.core is loaded on server, so helpers like benchmark can be called
+    has_core = False
+
     def __init__(self):
         self.status = None
         self.disconnecting = False
+        self.connect_time = None
         self.window = sublime.active_window()
+        self.scheduler = cs_scheduler.Scheduler(
+            limit = lambda: cs_common.setting('max_parallel_evals'),
+            alive = lambda id: bool(cs_eval.by_batch(id)),
+            start = self.start_eval,
+            drop  = self.on_dropped)
+        self.buffer_evals = {} # eval id -> BufferEval waiting for that eval to finish
 
     def connect_impl(self):
         pass
@@ -25,6 +49,7 @@ class Connection:
         Connect to address specified during construction
         """
         state = cs_common.get_state()
+        self.connect_time = time.time()
         try:
             self.connect_impl()
             state.conn = self
@@ -40,6 +65,54 @@ class Connection:
     def eval_impl(self, form):
         pass
 
+    def schedule(self, id, send, priority = PRIORITY_INTERACTIVE):
+        """
+        Call `send()` now, or later if `max_parallel_evals` evals are already
+        running. Queued evals are started by priority, then in FIFO order.
+        Evals erased while in queue are dropped
+        """
+        self.scheduler.push(id, send, priority)
+        self.scheduler.dispatch()
+        # under lock, so that another thread can’t start it in between
+        # and have its 'pending' overwritten with 'queued'
+        with self.scheduler.lock:
+            if self.scheduler.is_queued(id):
+                for eval in cs_eval.by_batch(id):
+                    eval.update('queued', 'Queued')
+
+    def start_eval(self, id, send):
+        for eval in cs_eval.by_batch(id):
+            if eval.status == 'queued':
+                eval.update('pending', cs_progress.phase())
+        cs_progress.wake()
+        if (timeout := cs_common.setting('eval_timeout_ms')):
+            sublime.set_timeout_async(lambda: self.on_timeout(id), timeout)
+        send()
+
+    def on_timeout(self, id):
+        if self.scheduler.is_in_flight(id) and not self.disconnecting and (evals := cs_eval.by_batch(id)):
+            for eval in evals:
+                eval.update('interrupt', 'Timed out, interrupting...')
+            self.interrupt(id, id)
+
+    def on_dropped(self, id):
+        """
+        Eval was erased while in queue and will never be sent
+        """
+        if buffer_eval := self.buffer_evals.pop(id, None):
+            buffer_eval.on_done()
+
+    def on_done(self, id):
+        """
+        Should be called by subclasses when the server finished processing
+        eval or load_file with `id`. Frees a slot for queued evals
+        """
+        if not self.scheduler.done(id):
+            return
+        self.scheduler.dispatch()
+        if buffer_eval := self.buffer_evals.pop(id, None):
+            buffer_eval.on_done()
+
     def eval_region(self, region, view):
         if region.empty():
             if eval := cs_eval.by_region(view, region):
@@ -47,28 +120,35 @@ class Connection:
             return cs_parser.topmost_form(view, region.begin())
         return region
 
-    def eval(self, view, sel):
+    def eval(self, view, sel, priority = PRIORITY_INTERACTIVE, wrap = None):
         """
-        Eval code and call `cs_eval.on_success(id, value)` or `cs_eval.on_exception(id, value, trace)`
+        Eval code and call `cs_eval.on_success(id, value)` or `cs_eval.on_exception(id, value, trace)`.
+        `wrap` is optional (prefix, suffix) to put around code before sending it
         """
+        snapshot = cs_snapshot.snapshot(view)
         for region in sel:
             region = self.eval_region(region, view)
-            eval = cs_eval.Eval(view, region)
-            (line, column) = view.rowcol_utf16(region.begin())
+            # wrapped code is not what's in the buffer, don't count it as loaded
+            form_key = None if wrap else cs_eval.top_level_keys(view, [region])[0]
+            eval = cs_eval.Eval(view, region, form_key = form_key)
+            (line, column) = snapshot.rowcol_utf16(region.begin())
             line = line + 1
+            code = snapshot.substr(region.begin(), region.end())
+            if wrap:
+                code, column = wrap_code(wrap, code, column)
             form = cs_common.Form(
                     id     = eval.id,
-                    code   = view.substr(region),
+                    code   = code,
                     ns     = cs_parser.namespace(view, region.begin()) or 'user',
                     line   = line,
                     column = column,
                     file   = view.file_name())
-            self.eval_impl(form)
+            self.schedule(form.id, lambda form = form: self.eval_impl(form), priority)
 
     def eval_status(self, code, ns):
         eval = cs_eval_status.StatusEval(code)
         form = cs_common.Form(id = eval.id, code = code, ns = ns)
-        self.eval_impl(form)
+        self.schedule(form.id, lambda: self.eval_impl(form))
 
     def load_file_impl(self, id, file, path):
         pass
@@ -77,9 +157,62 @@ class Connection:
         """
         Load whole file (~load-file nREPL command). Same callbacks as `eval`
         """
-        region = sublime.Region(0, view.size())
+        snapshot = cs_snapshot.snapshot(view)
+        region = sublime.Region(0, snapshot.size())
         eval = cs_eval.Eval(view, region)
-        self.load_file_impl(eval.id, view.substr(region), view.file_name())
+        code = snapshot.text
+        self.schedule(eval.id, lambda: self.load_file_impl(eval.id, code, view.file_name()), PRIORITY_BULK)
+
+    def form_eval(self, view, node, ns, snapshot):
+        """
+        Creates Eval for a single top-level form and Form to send for it
+        """
+        eval = cs_eval.Eval(view, sublime.Region(node.start, node.end), erase = False, form_key = cs_parser.form_key(node, snapshot.text))
+        (line, column) = snapshot.rowcol_utf16(node.start)
+        form = cs_common.Form(
+            id     = eval.id,
+            code   = eval.code,
+            ns     = ns,
+            line   = line + 1,
+            column = column,
+            file   = view.file_name())
+        return (eval, form)
+
+    def eval_forms(self, view, nodes, title):
+        """
+        Eval top-level forms (children of cs_parser.parse_tree(view)) one by
+        one: each form gets its own result, next one is sent when previous is
+        done. Stops at first exception, remaining forms are marked skipped
+        """
+        if not nodes:
+            return
+        snapshot = cs_snapshot.snapshot(view)
+        namespaces = cs_parser.namespaces(cs_parser.parse_tree(view))
+        for node in nodes:
+            cs_eval.erase_intersecting(view, sublime.Region(node.start, node.end))
+        forms = [self.form_eval(view, node, namespaces.get(node.start) or 'user', snapshot) for node in nodes]
+        for eval, _ in forms[1:]:
+            eval.update('queued', 'Queued')
+        self.buffer_eval_start_impl(BufferEval(self, view.window(), forms, title))
+
+    def buffer_eval_start_impl(self, buffer_eval):
+        """
+        Called before `eval_forms` sends its first form. Should call
+        `buffer_eval.next()` once connection is ready to send it
+        """
+        buffer_eval.next()
+
+    def buffer_eval_finish_impl(self, buffer_eval):
+        """
+        Called when `eval_forms` has nothing more to send
+        """
+        pass
+
+    def eval_buffer(self, view):
+        """
+        Eval whole buffer form by form, see `eval_forms`
+        """
+        self.eval_forms(view, cs_parser.top_level_forms(cs_parser.parse_tree(view)), 'Eval buffer')
 
     def lookup_impl(self, id, symbol, ns):
         pass
@@ -88,7 +221,7 @@ class Connection:
         """
         Look symbol up and call `cs_eval.on_lookup(id, value)`
         """
-        symbol = view.substr(region)
+        symbol = cs_snapshot.snapshot(view).substr(region.begin(), region.end())
         ns     = cs_parser.namespace(view, region.begin()) or 'user'
         eval   = cs_eval.Eval(view, region)
         self.lookup_impl(eval.id, symbol, ns)
@@ -113,18 +246,76 @@ class Connection:
         if self.disconnecting:
             return
         self.disconnecting = True
+        self.scheduler.clear()
+        self.buffer_evals.clear()
+        cs_common.set_status(self.window, progress_key, None)
         self.disconnect_impl()
         state = cs_common.get_state()
         state.conn = None
         cs_common.set_status(self.window, status_key, None)
         cs_eval.erase_evals(lambda eval: eval.window == self.window)
+        if self.window:
+            for view in self.window.views():
+                cs_eval.loaded.pop(view.buffer_id(), None)
         cs_warn.reset_warnings(self.window)
 
     def set_status(self, phase, message, *args):
         status = phases[phase] + ' ' + message.format(*args)
+        if phase == 4 and not self.ready() and self.connect_time:
+            cs_common.debug('Ready in {:.2f} ms', (time.time() - self.connect_time) * 1000)
         self.status = status
         cs_common.set_status(self.window, status_key, status)
 
+class BufferEval:
+    """
+    Progress of `Connection.eval_forms`: sends forms one at a time and
+    shows `done/total` and time elapsed in status bar
+    """
+    def __init__(self, conn, window, forms, title):
+        self.conn = conn
+        self.window = window
+        self.forms = forms # [(Eval, cs_common.Form)]
+        self.title = title
+        self.session = None # set by connections that eval all forms in one session
+        self.idx = -1
+        self.start = time.time()
+
+    def elapsed(self):
+        return '{:.1f} sec'.format(time.time() - self.start)
+
+    def next(self):
+        """
+        Send next form that wasn’t erased (edited, cleared or re-evaluated) meanwhile
+        """
+        self.idx += 1
+        while self.idx < len(self.forms) and self.forms[self.idx][0].erased:
+            self.idx += 1
+        if self.idx >= len(self.forms):
+            self.finish(f'{self.title}: {len(self.forms)} forms in {self.elapsed()}')
+            return
+        eval, form = self.forms[self.idx]
+        cs_common.set_status(self.window, progress_key, f'{self.title}: {self.idx}/{len(self.forms)}, {self.elapsed()}')
+        self.conn.buffer_evals[form.id] = self
+        self.conn.schedule(form.id, lambda: self.conn.eval_impl(form), PRIORITY_BULK)
+
+    def on_done(self):
+        eval, _ = self.forms[self.idx]
+        if eval.status == 'exception':
+            for eval, _ in self.forms[self.idx + 1:]:
+                if not eval.erased:
+                    cs_eval.updates.push(eval, lambda eval = eval: eval.update('skipped', 'Skipped'))
+            self.finish(f'{self.title}: failed at {self.idx + 1}/{len(self.forms)}, {self.elapsed()}')
+        else:
+            self.next()
+
+    def finish(self, message):
+        self.conn.buffer_eval_finish_impl(self)
+        cs_common.set_status(self.window, progress_key, message)
+        def clear():
+            if not self.conn.buffer_evals:
+                cs_common.set_status(self.window, progress_key, None)
+        sublime.set_timeout(clear, 5000)
+
 class AddressInputHandler(sublime_plugin.TextInputHandler):
     def __init__(self, port_file = None, next_input = None):
         self.port_file = port_file
@@ -5,9 +5,85 @@ class ConnectionNreplJvm(cs_conn_nrepl_raw.ConnectionNreplRaw):
     """
     Enhanced nREPL connection that will work only on JVM
     """
+    has_core = True
+
     def __init__(self, addr):
         super().__init__(addr)
         self.eval_op = 'clone-eval-close'
+        self.pending_steps = set()
+        self.pool_size = 0
+        self.pool_idle = []   # [session]
+        self.pool_busy = {}   # eval id -> session
+        self.pool_clones = 0  # requested but not yet received
+        self.buffer_clones = {} # clone request id -> BufferEval waiting for its session
+
+    def pool_fill(self):
+        """
+        Clone sessions from the main one until pool has `pool_size` sessions.
+        Clones inherit everything `eval_shared` has set in the main session
+        """
+        while len(self.pool_idle) + len(self.pool_busy) + self.pool_clones < self.pool_size:
+            self.pool_clones += 1
+            self.send({'id':      'pool',
+                       'session': self.session,
+                       'op':      'clone'})
+
+    def pool_checkout(self, id):
+        if self.pool_idle:
+            session = self.pool_idle.pop()
+            self.pool_busy[id] = session
+            return session
+
+    def pool_release(self, id):
+        """
+        Sessions are reset by replacing them with fresh clones of the main
+        session, so that *1, *e, set! etc from one eval don’t leak into the next
+        """
+        if session := self.pool_busy.pop(id, None):
+            self.send({'op': 'close', 'session': session})
+            self.pool_fill()
+
+    def buffer_eval_start_impl(self, buffer_eval):
+        """
+        All forms of Eval Buffer run in one session cloned for that run, so
+        that (set! *warn-on-reflection* true) etc. apply to the forms after
+        it, like they do in load-file
+        """
+        id = f'buffer-{buffer_eval.forms[0][1].id}'
+        self.buffer_clones[id] = buffer_eval
+        self.send({'id':      id,
+                   'session': self.session,
+                   'op':      'clone'})
+
+    def buffer_eval_finish_impl(self, buffer_eval):
+        if buffer_eval.session and self.socket:
+            self.send({'op': 'close', 'session': buffer_eval.session})
+            buffer_eval.session = None
+
+    def eval_impl(self, form):
+        msg = self.eval_msg(form)
+        if (buffer_eval := self.buffer_evals.get(form.id)) and buffer_eval.session:
+            session = buffer_eval.session
+            if eval := cs_eval.by_id(form.id):
+                eval.session = session
+            msg['session'] = session
+            msg['op']      = 'eval'
+        elif session := self.pool_checkout(form.id):
+            if eval := cs_eval.by_id(form.id):
+                eval.session = session
+            msg['session'] = session
+            msg['op']      = 'eval'
+        self.send(msg)
+
+    def disconnect_impl(self):
+        if self.socket:
+            for session in self.pool_idle + list(self.pool_busy.values()):
+                self.send({'op': 'close', 'session': session})
+            self.pool_size = 0
+            self.pool_idle.clear()
+            self.pool_busy.clear()
+        self.buffer_clones.clear()
+        super().disconnect_impl()
 
     def send(self, msg):
         if self.ready():
@@ -25,50 +101,66 @@ class ConnectionNreplJvm(cs_conn_nrepl_raw.ConnectionNreplRaw):
         self.send(msg)
 
     def handle_connect(self, msg):
+        """
+        Handshake. Steps that don’t depend on each other are pipelined:
+        upload (2) and eval_shared (4) run in order in the same session,
+        add-middleware (3) is sent as soon as upload is done
+        """
         if 1 == msg.get('id') and 'new-session' in msg:
-            self.set_status(2, 'Uploading middleware 1/2...')
+            self.set_status(2, 'Uploading middleware...')
             self.session = msg['new-session']
-            file = cs_common.clojure_source('core.clj')
+            self.pending_steps = {2, 3}
             self.send({'id':      2,
                        'session': self.session,
-                       'op':      'load-file',
-                       'file':    file})
+                       'op':      'eval',
+                       'code':    cs_common.clojure_upload(cs_common.ns + '.middleware', ['core.clj', 'middleware.clj'])})
+            if eval_shared := cs_common.setting('eval_shared'):
+                self.pending_steps.add(4)
+                self.send({'id':      4,
+                           'session': self.session,
+                           'op':      'eval',
+                           'code':    eval_shared})
             return True
 
-        if 2 == msg.get('id') and 'done' in msg.get('status', []):
-            self.set_status(2, 'Uploading middleware 2/2...')
-            file = cs_common.clojure_source('middleware.clj')
-            self.send({'id':      3,
-                       'session': self.session,
-                       'op':      'load-file',
-                       'file':    file})
+        if 2 == msg.get('id') and 'value' in msg:
+            cs_common.debug('Middleware {}', msg['value'])
             return True
 
-        elif 3 == msg.get('id') and 'done' in msg.get('status', []):
-            self.set_status(2, 'Adding middlewares...')
-            eval_shared = cs_common.setting('eval_shared')
-            ns = cs_common.ns + '.middleware'
-            self.send({'id':               4 if eval_shared else 5,
-                       'session':          self.session,
-                       'op':               'add-middleware',
-                       'middleware':       [ns + '/clone-and-eval',
-                                            ns + '/time-eval',
-                                            ns + '/wrap-errors',
-                                            ns + '/wrap-output'],
-                       'extra-namespaces': [cs_common.ns + '.exception', ns]})
+        if msg.get('id') in self.pending_steps and 'done' in msg.get('status', []):
+            self.pending_steps.discard(msg['id'])
+            if 2 == msg['id']:
+                self.set_status(2, 'Adding middlewares...')
+                ns = cs_common.ns + '.middleware'
+                self.send({'id':               3,
+                           'session':          self.session,
+                           'op':               'add-middleware',
+                           'middleware':       [ns + '/clone-and-eval',
+                                                ns + '/time-eval',
+                                                ns + '/wrap-errors',
+                                                ns + '/wrap-output'],
+                           'extra-namespaces': [cs_common.ns + '.exception', ns]})
+            if not self.pending_steps:
+                self.set_status(4, self.addr)
+                self.pool_size = cs_common.setting('session_pool_size', 0)
+                self.pool_fill()
             return True
 
-        elif 4 == msg.get('id') and 'done' in msg.get('status', []):
-            self.set_status(3, 'Evaluating session code...')
-            eval_shared = cs_common.setting('eval_shared')
-            self.send({'id':      5,
-                       'session': self.session,
-                       'op':      'eval',
-                       'code':    eval_shared})
+    def handle_pool(self, msg):
+        id = msg.get('id')
+        if 'pool' == id and 'new-session' in msg:
+            self.pool_clones -= 1
+            if len(self.pool_idle) + len(self.pool_busy) < self.pool_size:
+                self.pool_idle.append(msg['new-session'])
+            else:
+                self.send({'op': 'close', 'session': msg['new-session']})
             return True
+        elif id in self.pool_busy and 'done' in msg.get('status', []):
+            self.pool_release(id)
 
-        elif 5 == msg.get('id') and 'done' in msg.get('status', []):
-            self.set_status(4, self.addr)
+    def handle_buffer_clone(self, msg):
+        if 'new-session' in msg and (buffer_eval := self.buffer_clones.pop(msg.get('id'), None)):
+            buffer_eval.session = msg['new-session']
+            buffer_eval.next()
             return True
 
     def handle_new_session(self, msg):
@@ -81,7 +173,9 @@ class ConnectionNreplJvm(cs_conn_nrepl_raw.ConnectionNreplRaw):
             time = msg.get(cs_common.ns + '.middleware/time-taken')
             if time:
                 time = time / 1000000
-            cs_eval.on_success(id, msg.get('value'), time = time)
+            ns = cs_common.ns + '.middleware/'
+            stats = {key: msg[ns + key] for key in ('alloc', 'gc_count', 'gc_time') if ns + key in msg}
+            cs_eval.on_success(id, msg.get('value'), time = time, stats = stats, details = msg.get(ns + 'details'))
             return True
 
     def handle_exception(self, msg):
@@ -110,8 +204,13 @@ class ConnectionNreplJvm(cs_conn_nrepl_raw.ConnectionNreplRaw):
         for key in msg.get('nrepl.middleware.print/truncated-keys', []):
             msg[key] += ' ...'
 
+        if (id := msg.get('id')) and 'done' in msg.get('status', []):
+            self.on_done(id)
+
         self.handle_connect(msg) \
         or self.handle_disconnect(msg) \
+        or self.handle_pool(msg) \
+        or self.handle_buffer_clone(msg) \
         or self.handle_new_session(msg) \
         or self.handle_value(msg) \
         or self.handle_exception(msg) \
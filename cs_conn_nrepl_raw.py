@@ -1,5 +1,5 @@
-import os, sublime, sublime_plugin, threading
-from . import cs_bencode, cs_common, cs_conn, cs_eval, cs_parser, cs_printer
+import sublime, sublime_plugin, threading
+from . import cs_async, cs_bencode, cs_common, cs_conn, cs_eval, cs_parser, cs_printer
 
 class ConnectionNreplRaw(cs_conn.Connection):
     """
@@ -16,9 +16,13 @@ class ConnectionNreplRaw(cs_conn.Connection):
 
     def connect_impl(self):
         self.set_status(0, 'Connecting to {}...', self.addr)
-        self.socket = cs_common.socket_connect(self.addr)
-        self.reader = threading.Thread(daemon=True, target=self.read_loop)
-        self.reader.start()
+        if cs_async.enabled():
+            self.socket = cs_async.Transport(self.addr)
+            self.socket.start(self.read_loop_async)
+        else:
+            self.socket = cs_common.socket_connect(self.addr)
+            self.reader = threading.Thread(daemon=True, target=self.read_loop)
+            self.reader.start()
 
     def disconnect_impl(self):
         if self.socket:
@@ -38,11 +42,21 @@ class ConnectionNreplRaw(cs_conn.Connection):
             pass
         self.disconnect()
 
+    async def read_loop_async(self, reader):
+        try:
+            self.set_status(1, 'Cloning session')
+            self.send({'op': 'clone', 'id': 1})
+            async for msg in cs_bencode.decode_stream(reader):
+                self.handle_msg(msg)
+        except (OSError, EOFError):
+            pass
+        self.disconnect()
+
     def send(self, msg):
         cs_common.debug('SND {}', msg)
         self.socket.sendall(cs_bencode.encode(msg).encode())
 
-    def eval_impl(self, form):
+    def eval_msg(self, form):
         msg = {'id':      form.id,
                'session': self.session,
                'op':      self.eval_op,
@@ -54,17 +68,13 @@ class ConnectionNreplRaw(cs_conn.Connection):
             msg['column'] = column
         if (file := form.file) is not None:
             msg['file'] = file
-        self.send(msg)
+        return msg
 
-    def load_file_impl(self, id, file, path):
-        msg = {'id':        id,
-               'session':   self.session,
-               'op':        'load-file',
-               'file':      file,
-               'file-name': os.path.basename(path) if path else "NO_SOURCE_FILE.cljc"}
-        if path:
-            msg['file-path'] = path
-        self.send(msg)
+    def eval_impl(self, form):
+        self.send(self.eval_msg(form))
+
+    def load_file(self, view):
+        self.eval_buffer(view)
 
     def lookup_impl(self, id, symbol, ns):
         msg = {'id':      id,
@@ -134,6 +144,7 @@ class ConnectionNreplRaw(cs_conn.Connection):
     def handle_done(self, msg):
         if (id := msg.get('id')) and (status := msg.get('status')) and 'done' in status:
             cs_eval.on_done(id)
+            self.on_done(id)
 
     def handle_msg(self, msg):
         cs_common.debug('RCV {}', msg)
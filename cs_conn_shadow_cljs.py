@@ -63,9 +63,9 @@ class ConnectionShadowCljs(cs_conn_nrepl_raw.ConnectionNreplRaw):
 
     def load_file(self, view):
         if view.file_name():
-            super().load_file(view)
+            cs_conn.Connection.load_file(self, view)
         else:
-            self.eval(view, [sublime.Region(0, view.size())])
+            self.eval(view, [sublime.Region(0, view.size())], priority = cs_conn.PRIORITY_BULK)
 
 
 class BuildInputHandler(sublime_plugin.TextInputHandler):
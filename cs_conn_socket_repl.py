@@ -1,5 +1,5 @@
 import json, os, re, sublime, sublime_plugin, threading
-from . import cs_common, cs_conn, cs_eval, cs_eval_status, cs_parser, cs_warn
+from . import cs_async, cs_common, cs_conn, cs_eval, cs_eval_status, cs_parser, cs_snapshot, cs_warn
 
 def lines(socket):
     buffer = b''
@@ -19,42 +19,63 @@ class ConnectionSocketRepl(cs_conn.Connection):
     """
     Upgraded Socket REPL: does what nREPL JVM does, but without extra dependencies
     """
+    has_core = True
+
     def __init__(self, addr):
         super().__init__()
         self.addr      = addr
         self.socket    = None
         self.reader    = None
         self.closing   = False
+        self.started   = False
 
     def connect_impl(self):
         self.set_status(0, 'Connecting to {}', self.addr)
-        self.socket = cs_common.socket_connect(self.addr)
-        self.reader = threading.Thread(daemon=True, target=self.read_loop)
-        self.reader.start()
+        if cs_async.enabled():
+            self.socket = cs_async.Transport(self.addr)
+            self.socket.start(self.read_loop_async)
+        else:
+            self.socket = cs_common.socket_connect(self.addr)
+            self.reader = threading.Thread(daemon=True, target=self.read_loop)
+            self.reader.start()
 
     def disconnect_impl(self):
         if self.socket:
             self.socket.close()
             self.socket = None
 
+    def upgrade(self):
+        self.set_status(1, 'Upgrading REPL')
+        self.started = False
+        self.send(cs_common.clojure_upload(cs_common.ns + '.socket-repl', ['core.clj', 'socket_repl.clj']) + '\n')
+        if shared := cs_common.setting('eval_shared'):
+            self.send(shared)
+        self.send(f"({cs_common.ns}.socket-repl/repl)\n")
+
+    def handle_line(self, line):
+        cs_common.debug('RCV {}', line)
+        if self.started:
+            msg = cs_parser.parse_as_dict(line)
+            self.handle_msg(msg)
+        else:
+            if '{"tag" "started"}' in line:
+                self.set_status(4, self.addr)
+                self.started = True
+
     def read_loop(self):
         try:
-            self.set_status(1, 'Upgrading REPL')
-            self.send(cs_common.clojure_source('core.clj'))
-            self.send(cs_common.clojure_source('socket_repl.clj'))
-            if shared := cs_common.setting('eval_shared'):
-                self.send(shared)
-            self.send("(repl)\n")
-            started = False
+            self.upgrade()
             for line in lines(self.socket):
-                cs_common.debug('RCV {}', line)
-                if started:
-                    msg = cs_parser.parse_as_dict(line)
-                    self.handle_msg(msg)
-                else:
-                    if '{"tag" "started"}' in line:
-                        self.set_status(4, self.addr)
-                        started = True
+                self.handle_line(line)
+        except OSError:
+            pass
+        self.disconnect()
+
+    async def read_loop_async(self, reader):
+        try:
+            self.upgrade()
+            async for line in cs_async.lines(reader):
+                self.handle_line(line)
         except OSError:
             pass
         self.disconnect()
@@ -81,46 +102,71 @@ class ConnectionSocketRepl(cs_conn.Connection):
         msg += '}'
         self.send(msg)
 
-    def eval(self, view, sel):
+    def eval(self, view, sel, priority = cs_conn.PRIORITY_INTERACTIVE, wrap = None):
         cs_warn.reset_warnings(self.window)
+        snapshot = cs_snapshot.snapshot(view)
         for region in sel:
             # find regions to eval
             region = self.eval_region(region, view)
 
             start = region.begin()
-            parsed = cs_parser.parse(view.substr(region))
-            forms = [ \
-                sublime.Region(start + child.start, start + child.end) \
-                for child in parsed.children \
-                if child.name not in {'comment', 'discard'} \
-            ]
+            code = snapshot.substr(region.begin(), region.end())
+            if wrap:
+                # wrapped code is a single form
+                forms = [region]
+            else:
+                parsed = cs_parser.parse(code)
+                forms = [ \
+                    sublime.Region(start + child.start, start + child.end) \
+                    for child in parsed.children \
+                    if child.name not in {'comment', 'discard'} \
+                ]
             
-            # create evals
+            # create evals. Forms on the same line shouldn’t erase each other
             batch_id = cs_eval.Eval.next_id()
-            for idx, form in enumerate(forms):
-                eval = cs_eval.Eval(view, form, id = f'{batch_id}.{idx}', batch_id = batch_id)
+            for form in forms:
+                cs_eval.erase_intersecting(view, form)
+            form_keys = [None] * len(forms) if wrap else cs_eval.top_level_keys(view, forms)
+            for idx, (form, form_key) in enumerate(zip(forms, form_keys)):
+                eval = cs_eval.Eval(view, form, id = f'{batch_id}.{idx}', batch_id = batch_id, erase = False, form_key = form_key)
 
             # send msg
-            (line, column) = view.rowcol_utf16(region.begin())
+            (line, column) = snapshot.rowcol_utf16(region.begin())
+            if wrap:
+                code, column = cs_conn.wrap_code(wrap, code, column)
             form = cs_common.Form(
                 id   = batch_id,
-                code = view.substr(region).replace('\\', '\\\\').replace('"', '\\"'),
+                code = code.replace('\\', '\\\\').replace('"', '\\"'),
                 ns   = cs_parser.namespace(view, region.begin()) or 'user',
                 line = line + 1,
                 column = column,
                 file = view.file_name()
             )
-            self.eval_impl(form)
+            self.schedule(batch_id, lambda form = form: self.eval_impl(form), priority)
+
+    def form_eval(self, view, node, ns, snapshot):
+        batch_id = cs_eval.Eval.next_id()
+        region = sublime.Region(node.start, node.end)
+        eval = cs_eval.Eval(view, region, id = f'{batch_id}.0', batch_id = batch_id, erase = False, form_key = cs_parser.form_key(node, snapshot.text))
+        (line, column) = snapshot.rowcol_utf16(node.start)
+        form = cs_common.Form(
+            id     = batch_id,
+            code   = eval.code.replace('\\', '\\\\').replace('"', '\\"'),
+            ns     = ns,
+            line   = line + 1,
+            column = column,
+            file   = view.file_name())
+        return (eval, form)
 
     def eval_status(self, code, ns):
         cs_warn.reset_warnings(self.window)
         batch_id = cs_eval.Eval.next_id()
         eval = cs_eval_status.StatusEval(code, id = f'{batch_id}.0', batch_id = batch_id)
         form = cs_common.Form(id = batch_id, code = code, ns = ns)
-        self.eval_impl(form)
+        self.schedule(batch_id, lambda: self.eval_impl(form))
 
     def load_file(self, view):
-        self.eval(view, [sublime.Region(0, view.size())])
+        self.eval(view, [sublime.Region(0, view.size())], priority = cs_conn.PRIORITY_BULK)
 
     def lookup_impl(self, id, symbol, ns):
         msg = f'{{"id" {id}, "op" "lookup", "symbol" "{symbol}", "ns" "{ns}"}}'
@@ -136,7 +182,8 @@ class ConnectionSocketRepl(cs_conn.Connection):
             idx  = msg.get('idx')
             val  = msg.get('val')
             time = msg.get('time')
-            cs_eval.on_success(f'{id}.{idx}', val, time = time)
+            stats = {key: msg[key] for key in ('alloc', 'gc_count', 'gc_time') if key in msg}
+            cs_eval.on_success(f'{id}.{idx}', val, time = time, stats = stats, details = msg.get('details'))
             return True
 
     def handle_exception(self, msg):
@@ -156,6 +203,7 @@ class ConnectionSocketRepl(cs_conn.Connection):
         if 'done' == msg['tag']:
             batch_id = msg.get('id')
             cs_eval.on_done(batch_id)
+            self.on_done(batch_id)
             return True
 
     def handle_lookup(self, msg):
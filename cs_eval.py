@@ -1,9 +1,109 @@
-import collections, html, os, re, sublime, sublime_plugin
+import collections, html, os, re, sublime, sublime_plugin, threading, time
 from typing import Any, Dict, Tuple
-from . import cs_common, cs_conn, cs_eval_status, cs_parser, cs_printer, cs_progress
+from . import cs_common, cs_conn, cs_eval_status, cs_intervals, cs_parser, cs_printer, cs_progress, cs_registry, cs_snapshot
 
-evals = {} # Dict[int, Eval]
-evals_by_view = collections.defaultdict(dict) # Dict[int, Dict[int, Eval]]
+evals = cs_registry.Registry(post = sublime.set_timeout) # Registry[int, Eval], owned by UI thread
+indexes = collections.defaultdict(cs_intervals.IntervalIndex) # Dict[int, IntervalIndex], view id -> eval ids
+loaded = collections.defaultdict(dict) # Dict[int, Dict[str, int]], buffer id -> form key -> hash of last successfully evaluated text
+
+def escape(value):
+    return html.escape(value).replace("\t", "  ").replace(" ", " ")
+
+class RenderCache:
+    """
+    Bounded LRU of rendered phantom contents, (text, wrap width, pprint) -> Pages
+    """
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            if (value := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last = False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+render_cache = RenderCache(32)
+
+# texts longer than that are rendered in background
+render_async_threshold = 10000
+
+# how many lines phantom shows at first and adds on "Show more"
+page_lines = 100
+
+def split_lines(text):
+    """
+    Lazy version of text.splitlines()
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        end = text.find("\n", start)
+        if end == -1:
+            end = length
+        yield text[start:end].rstrip("\r")
+        start = end + 1
+
+class Pages:
+    """
+    Phantom content, rendered lazily line by line as more pages are requested.
+    Doesn’t touch Sublime API, so can be used from any thread
+    """
+    def __init__(self, text, limit, pprint = False):
+        self.text = text
+        self.limit = limit
+        self.pprint = pprint
+        self.lines = None
+        self.rendered = [] # html, one <p> per line
+        self.done = False
+        self.lock = threading.Lock()
+
+    def source_lines(self):
+        if self.pprint:
+            return (line.rstrip("\r") for line in cs_printer.format_lines(self.text, cs_parser.parse(self.text), limit = self.limit))
+        return split_lines(self.text)
+
+    def take(self, n = None):
+        """
+        Returns (first n rendered lines or all if n is None, are there more lines)
+        """
+        with self.lock:
+            if self.lines is None:
+                self.lines = self.source_lines()
+            while not self.done and (n is None or len(self.rendered) <= n):
+                try:
+                    line = next(self.lines)
+                    self.rendered.append("<p>" + escape(cs_printer.wrap_string(line, limit = self.limit)) + "</p>")
+                except StopIteration:
+                    self.done = True
+            if n is None:
+                return (self.rendered[:], False)
+            return (self.rendered[:n], len(self.rendered) > n)
+
+    def ready(self, n):
+        """
+        True if taking n lines (all if n is None) won’t need any rendering
+        """
+        return self.done or (n is not None and len(self.rendered) > n)
+
+def pages(text, limit, pprint = False):
+    key = (text, limit, pprint)
+    if (res := render_cache.get(key)) is None:
+        res = Pages(text, limit, pprint)
+        render_cache.put(key, res)
+    return res
 
 class Eval:
     """
@@ -19,36 +119,51 @@ class Eval:
     batch_id:     int
     view:         sublime.View
     window:       sublime.Window
-    status:       str # "pending" | "interrupt" | "success" | "exception" | "lookup"
+    status:       str # "queued" | "pending" | "interrupt" | "success" | "exception" | "skipped" | "lookup"
     code:         str
     session:      str
     trace:        str
+    details:      str # e.g. profile, shown in phantom instead of value
     phantom_id:   int
+    phantom_pages: Pages
 
     def next_id():
         Eval.last_id += 1
         return Eval.last_id
     
-    def __init__(self, view, region, id = None, batch_id = None):
-        extended_region = view.line(region)
-        erase_evals(lambda eval: eval.region() and eval.region().intersects(extended_region), view)
+    def __init__(self, view, region, id = None, batch_id = None, erase = True, form_key = None):
+        """
+        Erases evals on the same lines, unless `erase` is False: when creating
+        several evals at once, call `erase_intersecting` for all of them first,
+        so that forms sharing a line don’t erase each other.
+        `form_key` is cs_parser.form_key if region is a top-level form, remembered
+        in `loaded` on success
+        """
+        snapshot = cs_snapshot.snapshot(view)
+        if erase:
+            erase_intersecting(view, region)
         
         id = id or Eval.next_id()
         self.id = id
         self.batch_id = batch_id or id
         self.view = view
         self.window = view.window()
-        self.code = view.substr(region)
+        self.code = snapshot.substr(region.begin(), region.end())
+        self.code_len = len(self.code)
+        self.code_hash = hash(self.code)
+        self.form_key = form_key
         self.session = None
         self.ex_source = None
         self.ex_line = None
         self.ex_column = None
         self.trace = None
+        self.details = None
         self.phantom_id = None
+        self.phantom_pages = None
         self.value = None
+        self.erased = False
         
-        evals[id] = self
-        evals_by_view[view.id()][id] = self
+        evals.add(id, view.id(), self)
 
         self.update("pending", cs_progress.phase(), region)
         cs_progress.wake()        
@@ -64,10 +179,12 @@ class Eval:
                     colors = self.view.style_for_scope(scope)
                     if colors != default:
                         return (scope, colors.get(key))
+            Eval.colors["queued"]    = try_scopes("region.eval.queued",    "region.eval.pending",   "region.bluish")
             Eval.colors["pending"]   = try_scopes("region.eval.pending",   "region.bluish")
             Eval.colors["interrupt"] = try_scopes("region.eval.interrupt", "region.eval.pending", "region.bluish")
             Eval.colors["success"]   = try_scopes("region.eval.success",   "region.greenish")
             Eval.colors["exception"] = try_scopes("region.eval.exception", "region.redish")
+            Eval.colors["skipped"]   = try_scopes("region.eval.skipped",   "region.eval.queued",    "region.eval.pending",   "region.bluish")
             Eval.colors["lookup"]    = try_scopes("region.eval.lookup",    "region.eval.pending",   "region.bluish")
             Eval.colors["phantom_success_fg"] = try_scopes("region.phantom.success")
             Eval.colors["phantom_success_bg"] = try_scopes("region.phantom.success", key = "background")
@@ -76,48 +193,101 @@ class Eval:
         scope = scope or self.status
         return Eval.colors[scope]
 
+    def changed(self, region):
+        """
+        True if region text no longer matches evaluated code.
+        Checks length first, to avoid copying text when we can
+        """
+        return region.size() != self.code_len or hash(self.view.substr(region)) != self.code_hash
+
     def region(self):
         regions = self.view.get_regions(self.value_key())
         if regions and len(regions) >= 1:
             return regions[0]
 
     def escape(self, value):
-        return html.escape(value).replace("\t", "  ").replace(" ", " ")
+        return escape(value)
 
-    def update(self, status, value, region = None, time_taken = None):
+    def update(self, status, value, region = None, time_taken = None, stats = None):
         self.status = status
         self.value = value
         region = region or self.region()
         if region:
+            indexes[self.view.id()].set(self.id, region.begin(), region.end())
             scope, color = self.scope_color()
             if value:
-                if (self.status in {"success", "exception"}) and (time := cs_common.format_time_taken(time_taken)):
-                    value = time + " " + value
+                if self.status in {"success", "exception"}:
+                    if (stats := cs_common.format_stats(stats)):
+                        value = stats + " " + value
+                    if (time := cs_common.format_time_taken(time_taken)):
+                        value = time + " " + value
                 self.view.add_regions(self.value_key(), [region], scope, '', sublime.DRAW_NO_FILL + sublime.NO_UNDO, [self.escape(value)], color)
             else:
                 self.view.erase_regions(self.value_key())
                 self.view.add_regions(self.value_key(), [region], scope, '', sublime.DRAW_NO_FILL + sublime.NO_UNDO)
 
-    def toggle_phantom(self, text, styles):
+    def add_phantom(self, content, styles, on_navigate = None):
+        """
+        Adds block phantom with pre-rendered content below eval region, returns its id
+        """
+        if region := self.region():
+            body = f"""<body id='clojure-sublimed'>
+                { cs_common.basic_styles(self.view) }
+                { styles }
+            </style>{ content }</body>"""
+            point = cs_snapshot.line(self.view, region.end()).begin()
+            return self.view.add_phantom(self.value_key(), sublime.Region(point, point), body, sublime.LAYOUT_BLOCK, on_navigate)
+
+    def show_page(self, pages, lines, styles):
+        """
+        (Re)creates phantom showing first `lines` lines of pages, with links to show more
+        """
+        content, more = pages.take(lines)
+        content = "".join(content)
+        if more:
+            content += "<p><a href='more'>Show more</a> · <a href='all'>Show all</a></p>"
+        def on_navigate(href):
+            if self.phantom_pages is pages and not self.erased:
+                self.view.erase_phantom_by_id(self.phantom_id)
+                self.phantom_id = None
+                self.show_page_async(pages, None if href == 'all' else lines + page_lines, styles)
+        self.phantom_pages = pages
+        self.phantom_id = self.add_phantom(content, styles, on_navigate)
+
+    def show_page_async(self, pages, lines, styles):
+        """
+        Same as show_page, but if big text needs rendering, does it in background,
+        with a placeholder phantom shown meanwhile
+        """
+        if len(pages.text) < render_async_threshold or pages.ready(lines):
+            self.show_page(pages, lines, styles)
+        else:
+            placeholder = self.add_phantom("<p>Formatting…</p>", styles)
+            self.phantom_id = placeholder
+            self.phantom_pages = pages
+            def swap():
+                if placeholder and self.phantom_id == placeholder and not self.erased:
+                    self.view.erase_phantom_by_id(placeholder)
+                    self.show_page(pages, lines, styles)
+            def work():
+                pages.take(lines)
+                sublime.set_timeout(swap)
+            threading.Thread(daemon = True, target = work).start()
+
+    def toggle_phantom(self, text, styles, pprint = False):
+        """
+        Show/hide text (pretty-printed if pprint) in a phantom, page by page.
+        Rendering big texts happens in background, with a placeholder phantom
+        shown meanwhile
+        """
         if text:
             if self.phantom_id:
                 self.view.erase_phantom_by_id(self.phantom_id)
                 self.phantom_id = None
+                self.phantom_pages = None
             else:
-                body = f"""<body id='clojure-sublimed'>
-                    { cs_common.basic_styles(self.view) }
-                    { styles }
-                </style>"""
-                limit = cs_common.wrap_width(self.view)
-                for line in text.splitlines():
-                    line = cs_printer.wrap_string(line, limit = limit)
-                    line = self.escape(line)
-                    body += "<p>" + line + "</p>"
-                body += "</body>"
-                region = self.region()
-                if region:
-                    point = self.view.line(region.end()).begin()
-                    self.phantom_id = self.view.add_phantom(self.value_key(), sublime.Region(point, point), body, sublime.LAYOUT_BLOCK)
+                ps = pages(text, cs_common.wrap_width(self.view), pprint)
+                self.show_page_async(ps, page_lines, styles)
 
     def phantom_styles(self, scope):
         try:
@@ -133,16 +303,20 @@ class Eval:
         except:
             pass
 
-    def toggle_pprint(self):
-        node = cs_parser.parse(self.value)
-        string = cs_printer.format(self.value, node, limit = cs_common.wrap_width(self.view))
+    def success_styles(self):
         styles = """
             .light body { background-color: hsl(100, 100%, 90%); }
             .dark body  { background-color: hsl(100, 100%, 10%); }
         """ 
         if phantom_styles := self.phantom_styles("phantom_success"):
             styles += f".light body, .dark body {{ {phantom_styles}; border: 4px solid #CC3333; }}"
-        self.toggle_phantom(string, styles)
+        return styles
+
+    def toggle_pprint(self):
+        self.toggle_phantom(self.value, self.success_styles(), pprint = True)
+
+    def toggle_details(self):
+        self.toggle_phantom(self.details, self.success_styles())
         
     def toggle_trace(self):
         styles = """
@@ -154,14 +328,26 @@ class Eval:
         self.toggle_phantom(self.trace, styles)
 
     def erase(self, interrupt = True):
+        if self.erased:
+            return
+        self.erased = True
         self.view.erase_regions(self.value_key())
         if self.phantom_id:
             self.view.erase_phantom_by_id(self.phantom_id)
 
-        del evals[self.id]
-        del evals_by_view[self.view.id()][self.id]
-        if interrupt and self.status == "pending" and self.session:
-            cs_common.conn.send({"op": "interrupt", "interrupt-id": self.id, "session": self.session})
+        evals.remove(self.id, self.view.id())
+        indexes[self.view.id()].remove(self.id)
+        if interrupt and self.status == "pending" and self.session and (conn := cs_common.get_state(self.window).conn):
+            conn.interrupt(self.batch_id, self.id)
+
+def erase_intersecting(view, region):
+    """
+    Erase evals on the lines region touches
+    """
+    extended_region = cs_snapshot.line(view, region)
+    for eval in by_range(view, extended_region):
+        if (reg := eval.region()) and reg.intersects(extended_region):
+            eval.erase()
 
 def by_id(id):
     """
@@ -170,13 +356,33 @@ def by_id(id):
     state = cs_common.get_state()
     if (eval := state.status_eval) and id == eval.id:
         return eval
-    return evals.get(id, None)
+    if (eval := evals.get(id)) and not eval.erased:
+        return eval
+
+def by_batch(batch_id):
+    """
+    Find all evals sent to server as batch_id. Might return status_eval
+    """
+    if eval := by_id(batch_id):
+        return [eval]
+    state = cs_common.get_state()
+    if (eval := state.status_eval) and eval.batch_id == batch_id:
+        return [eval]
+    return [eval for eval in evals.values() if eval.batch_id == batch_id and not eval.erased]
+
+def by_range(view, region):
+    """
+    Evals which regions might touch region, according to index
+    """
+    view_id = view.id()
+    es = (evals.get_in_view(view_id, id) for id in indexes[view_id].query(region.begin(), region.end()))
+    return [eval for eval in es if eval and not eval.erased]
 
 def by_region(view, region):
     """
     Find an eval touching region
     """
-    for eval in evals_by_view[view.id()].values():
+    for eval in by_range(view, region):
         if cs_common.regions_touch(eval.region(), region):
             return eval
 
@@ -184,29 +390,97 @@ def by_status(view, status):
     """
     Find evals by status
     """
-    return (eval for eval in evals_by_view[view.id()].values() if eval.status == status)
+    return [eval for eval in evals.values_in_view(view.id()) if eval.status == status and not eval.erased]
 
 def erase_evals(predicate = lambda x: True, view = None):
     """
     Kill evals based on predicate
     """
     if view:
-        es = list(evals_by_view[view.id()].items())
+        es = list(evals.values_in_view(view.id()))
     else:
-        es = list(evals.items())
+        es = list(evals.values())
         state = cs_common.get_state(view.window() if view else None)
         if eval := state.status_eval:
-            es += [(eval.id, eval)]
-    for id, eval in es:
+            es += [eval]
+    for eval in es:
         if predicate(eval):
             eval.erase()
 
-def on_success(id, value, time = None):
+class UpdateQueue:
+    """
+    Results arrive on connection threads. Instead of touching UI for each one,
+    we collect them and apply on UI thread once per frame. Several updates
+    to the same eval within a frame are merged, only the last one is applied
+    """
+    frame_ms = 16
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.updates = {} # id -> (eval, fn, queued_time)
+        self.scheduled = False
+
+    def push(self, eval, fn):
+        with self.lock:
+            _, _, queued = self.updates.get(eval.id, (None, None, time.perf_counter()))
+            self.updates[eval.id] = (eval, fn, queued)
+            if not self.scheduled:
+                self.scheduled = True
+                sublime.set_timeout(self.flush, self.frame_ms)
+
+    def flush(self):
+        with self.lock:
+            updates, self.updates = self.updates, {}
+            self.scheduled = False
+        start = time.perf_counter()
+        latency = max(start - queued for _, _, queued in updates.values()) if updates else 0
+        # group by view to apply updates to the same view together
+        for eval, fn, _ in sorted(updates.values(), key = lambda u: u[0].view.id() if hasattr(u[0], 'view') else 0):
+            if by_id(eval.id) is eval:
+                try:
+                    fn()
+                except Exception:
+                    cs_common.error('Failed to update eval {}', eval.id)
+        cs_common.debug('Flushed {} eval updates in {:.2f} ms, max latency {:.2f} ms', len(updates), (time.perf_counter() - start) * 1000, latency * 1000)
+
+updates = UpdateQueue()
+
+def top_level_keys(view, regions):
+    """
+    For each region, cs_parser.form_key if region is exactly a top-level
+    form, None otherwise. Regions must be sorted
+    """
+    text = cs_snapshot.snapshot(view).text
+    children = iter(cs_parser.parse_tree(view).children)
+    child = next(children, None)
+    res = []
+    for region in regions:
+        while child and child.start < region.begin():
+            child = next(children, None)
+        if child and child.start == region.begin() and child.end == region.end():
+            res.append(cs_parser.form_key(child, text))
+        else:
+            res.append(None)
+    return res
+
+def on_success(id, value, time = None, stats = None, details = None):
     """
-    Callback to be called after conn.eval or conn.load_file
+    Callback to be called after conn.eval or conn.load_file.
+    `stats` is optional {'alloc': bytes, 'gc_count': int, 'gc_time': ms}.
+    `details` is optional longer text (e.g. profile) shown in a phantom right away
     """
     if (eval := by_id(id)):
-        eval.update('success', value, time_taken = time)
+        eval.status = 'success'
+        eval.value = value
+        if isinstance(eval, Eval):
+            eval.details = details
+        def update():
+            if isinstance(eval, Eval) and eval.form_key:
+                loaded[eval.view.buffer_id()][eval.form_key] = eval.code_hash
+            eval.update('success', value, time_taken = time, stats = stats)
+            if details and isinstance(eval, Eval) and not eval.phantom_id:
+                eval.toggle_details()
+        updates.push(eval, update)
 
 def on_exception(id, value, source = None, line = None, column = None, trace = None):
     """
@@ -217,14 +491,12 @@ def on_exception(id, value, source = None, line = None, column = None, trace = N
         eval.ex_line = line
         eval.ex_column = column
         eval.trace = trace
-        eval.update('exception', value)
+        eval.status = 'exception'
+        eval.value = value
+        updates.push(eval, lambda: eval.update('exception', value))
 
 def on_done(id):
-    if (eval := by_id(id)):
-        es = [eval]
-    else:
-        es = [eval for eval in evals.values() if eval.batch_id == id]
-    for eval in es:
+    for eval in by_batch(id):
         if eval.status not in {"success", "exception"}:
             eval.erase()
 
@@ -285,11 +557,15 @@ def on_lookup(id, value):
     Callback to be called after conn.lookup
     """
     if (eval := by_id(id)):
-        eval.update('lookup', None)
-        view = eval.view
-        body = format_lookup(view, value)
-        point = view.line(eval.region().end()).begin()
-        eval.phantom_id = view.add_phantom(eval.value_key(), sublime.Region(point, point), body, sublime.LAYOUT_BLOCK)
+        eval.status = 'lookup'
+        def show():
+            eval.update('lookup', None)
+            view = eval.view
+            body = format_lookup(view, value)
+            if region := eval.region():
+                point = cs_snapshot.line(view, region.end()).begin()
+                eval.phantom_id = view.add_phantom(eval.value_key(), sublime.Region(point, point), body, sublime.LAYOUT_BLOCK)
+        updates.push(eval, show)
 
 class ClojureSublimedEval(sublime_plugin.TextCommand):
     """
@@ -297,7 +573,8 @@ class ClojureSublimedEval(sublime_plugin.TextCommand):
     """
     def run(self, edit):
         state = cs_common.get_state(self.view.window())
-        state.conn.eval(self.view, self.view.sel())
+        with cs_common.Measure("Eval {}", self.view.sel()):
+            state.conn.eval(self.view, self.view.sel())
 
     def is_enabled(self):
         return cs_conn.ready(self.view.window())
@@ -308,11 +585,72 @@ class ClojureSublimedEvalBufferCommand(sublime_plugin.TextCommand):
     """
     def run(self, edit):
         state = cs_common.get_state(self.view.window())
-        state.conn.load_file(self.view)
+        with cs_common.Measure("Eval Buffer {} chars", self.view.size()):
+            state.conn.load_file(self.view)
         
     def is_enabled(self):
         return cs_conn.ready(self.view.window())
 
+class ClojureSublimedEvalChangedFormsCommand(sublime_plugin.TextCommand):
+    """
+    Eval only top-level forms that changed since they were last evaluated
+    successfully, one by one, stopping at first exception
+    """
+    def run(self, edit):
+        view = self.view
+        state = cs_common.get_state(view.window())
+        with cs_common.Measure("Eval Changed Forms {} chars", view.size()):
+            text = cs_snapshot.snapshot(view).text
+            forms = cs_parser.changed_forms(cs_parser.parse_tree(view), text, loaded[view.buffer_id()])
+            if forms:
+                # in order, one by one: later forms might depend on changed ns or defs
+                state.conn.eval_forms(view, forms, 'Eval changed forms')
+            else:
+                cs_common.set_status(view.window(), 'clojure-sublimed-changed-forms', 'No changed forms')
+                sublime.set_timeout(lambda: cs_common.set_status(view.window(), 'clojure-sublimed-changed-forms', None), 2000)
+
+    def is_enabled(self):
+        return cs_conn.ready(self.view.window())
+
+def wrap_core(fn, opts):
+    """
+    (prefix, suffix) for conn.eval that pass code as a no-args fn to
+    clojure-sublimed.core/`fn`, followed by opts map
+    """
+    opts = ' '.join(f':{key} {value}' for key, value in opts.items())
+    return (f'({cs_common.ns}.core/{fn} (fn [] ', f'\n) {{{opts}}})')
+
+class ClojureSublimedBenchmarkCommand(sublime_plugin.TextCommand):
+    """
+    Eval selected code or topmost form repeatedly on server, show time per call
+    """
+    def run(self, edit):
+        state = cs_common.get_state(self.view.window())
+        wrap = wrap_core('benchmark', {
+            'warmup-ms': cs_common.setting('benchmark_warmup_ms', 1000),
+            'time-ms':   cs_common.setting('benchmark_time_ms', 5000)})
+        state.conn.eval(self.view, self.view.sel(), wrap = wrap)
+
+    def is_enabled(self):
+        state = cs_common.get_state(self.view.window())
+        return cs_conn.ready(self.view.window()) and state.conn.has_core
+
+class ClojureSublimedProfileCommand(sublime_plugin.TextCommand):
+    """
+    Eval selected code or topmost form while sampling its stack on server,
+    show hottest frames and collapsed stacks in a phantom
+    """
+    def run(self, edit):
+        state = cs_common.get_state(self.view.window())
+        wrap = wrap_core('profile', {
+            'interval-ms': cs_common.setting('profile_interval_ms', 1),
+            'top':         cs_common.setting('profile_top_frames', 20)})
+        state.conn.eval(self.view, self.view.sel(), wrap = wrap)
+
+    def is_enabled(self):
+        state = cs_common.get_state(self.view.window())
+        return cs_conn.ready(self.view.window()) and state.conn.has_core
+
 class ClojureSublimedCopyCommand(sublime_plugin.TextCommand):
     """
     Copy .value of eval under cursor to clipboard
@@ -369,6 +707,8 @@ class ClojureSublimedToggleInfoCommand(sublime_plugin.TextCommand):
         if eval := by_region(view, sel):
             if eval.status == "exception":
                 eval.toggle_trace()
+            elif eval.status == "success" and eval.details:
+                eval.toggle_details()
             elif eval.status == "success":
                 eval.toggle_pprint()
             elif eval.status == 'lookup':
@@ -384,16 +724,17 @@ class ClojureSublimedClearEvalsCommand(sublime_plugin.TextCommand):
     Clear all completed evals in current view
     """
     def run(self, edit):
-        erase_evals(lambda eval: eval.status not in {"pending", "interrupt"}, self.view)
+        erase_evals(lambda eval: eval.status not in {"queued", "pending", "interrupt"}, self.view)
         state = cs_common.get_state(self.view.window())
-        if (eval := state.status_eval) and eval.status not in {"pending", "interrupt"}:
+        if (eval := state.status_eval) and eval.status not in {"queued", "pending", "interrupt"}:
             eval.erase()
 
 class ClojureSublimedInterruptEvalCommand(sublime_plugin.TextCommand):
     """
-    Interrupt first pending eval in current view
+    Interrupt first pending eval in current view. Drops all queued evals
     """
     def run(self, edit):
+        erase_evals(lambda eval: eval.status == "queued", self.view)
         es = list(by_status(self.view, 'pending'))
         state = cs_common.get_state(self.view.window())
         if (eval := state.status_eval) and eval.status not in {"pending", "interrupt"}:
@@ -414,17 +755,47 @@ class EventListener(sublime_plugin.EventListener):
         erase_evals(view = view)
 
 class TextChangeListener(sublime_plugin.TextChangeListener):
-    def on_text_changed_async(self, changes):
+    # how long to collect changes before checking touched evals
+    batch_ms = 50
+
+    def __init__(self):
+        super().__init__()
+        self.pending = {} # id -> Eval
+        self.scheduled = False
+
+    def on_text_changed(self, changes):
+        """
+        Shift indexed regions synchronously, so that index stays in sync with
+        evals created right after. Evals touching changes are re-read from view
+        and checked for erasing in one batch a bit later
+        """
         view = self.buffer.primary_view()
-        changed = [sublime.Region(x.a.pt, x.b.pt) for x in changes]
-        def should_erase(eval):
-            return not (reg := eval.region()) or any(reg.intersects(r) for r in changed) and view.substr(reg) != eval.code
-        erase_evals(should_erase, view)
+        index = indexes[view.id()]
+        touched = set()
+        for change in changes:
+            touched.update(index.replace(change.a.pt, change.b.pt, len(change.str)))
+        touched = [eval for id in touched if (eval := evals.get_in_view(view.id(), id)) and not eval.erased]
+        for eval in touched:
+            if reg := eval.region():
+                index.set(eval.id, reg.begin(), reg.end())
+            self.pending[eval.id] = eval
+        if self.pending and not self.scheduled:
+            self.scheduled = True
+            sublime.set_timeout_async(self.erase_changed, self.batch_ms)
+
+    def erase_changed(self):
+        self.scheduled = False
+        pending, self.pending = self.pending, {}
+        for eval in pending.values():
+            if not eval.erased and (not (reg := eval.region()) or eval.changed(reg)):
+                eval.erase()
 
 def on_settings_change(settings):
     Eval.colors.clear()
+    render_cache.clear()
 
 def plugin_loaded():
+    evals.owner = threading.current_thread()
     cs_common.on_settings_change(__name__, on_settings_change)
 
 def plugin_unloaded():
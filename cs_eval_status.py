@@ -28,12 +28,14 @@ class StatusEval:
         self.update('pending', cs_progress.phase())
         cs_progress.wake()
 
-    def update(self, status, value, time_taken = None):
+    def update(self, status, value, time_taken = None, stats = None):
         self.status = status
         self.value = value
-        if status in {"pending", "interrupt"}:
+        if status in {"queued", "pending", "interrupt"}:
             cs_common.set_status(self.window, status_key, "⏳ " + self.code)
         elif "success" == status:
+            if stats := cs_common.format_stats(stats):
+                value = stats + ' ' + value
             if time := cs_common.format_time_taken(time_taken):
                 value = time + ' ' + value
             cs_common.set_status(self.window, status_key, "✅ " + value)
@@ -53,8 +55,8 @@ class StatusEval:
         state = cs_common.get_state(self.window)
         cs_common.set_status(self.window, status_key, None)
         state.status_eval = None
-        if interrupt and self.status == "pending" and self.session:
-            state.conn.interrupt(self.id)
+        if interrupt and self.status == "pending" and self.session and state.conn:
+            state.conn.interrupt(self.batch_id, self.id)
 
 class ClojureSublimedEvalCodeCommand(sublime_plugin.WindowCommand):
     def run(self, code, ns = None):
@@ -67,6 +69,6 @@ class ClojureSublimedEvalCodeCommand(sublime_plugin.WindowCommand):
         if not cs_conn.ready(self.window):
             return False
         state = cs_common.get_state(self.window)
-        if state.status_eval and state.status_eval.status in {'pending', 'interrupt'}:
+        if state.status_eval and state.status_eval.status in {'queued', 'pending', 'interrupt'}:
             return False
         return True
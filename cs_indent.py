@@ -1,126 +1,218 @@
-import sublime, sublime_plugin
-from . import cs_common, cs_parser
-
-def search_path(node, pos):
-    """
-    Looks for the deepest node that wraps pos (start < pos < end).
-    Returns full path to that node from the top
-    """
-    res = [node]
-    for child in node.children:
-        if child.start < pos < child.end:
-            res += search_path(child, pos)
-        elif pos < child.start:
-            break
-    return res
+import sublime, sublime_plugin, threading, time
+from . import cs_common, cs_parser, cs_reindent, cs_snapshot
 
 def indent(view, point, parsed = None):
     """
-    Given point, returns (tag, row, indent) for that line, where indent
-    is a correct indent based on the last unclosed paren before point.
-
-    Tag could be 'string' (don't change anything, we're inside string),
-    'top-level' (set to 0, we are at top level) or 'indent' (normal behaviour)
-
-    Row is row number of the token for which this indent is based on (row of open paren)
-    """
-    parsed = parsed or cs_parser.parse(view.substr(sublime.Region(0, point)) + ' ')
-    if path := search_path(parsed, point):
-        node = None
-        first_form = None
-
-        # try finding unmatched open paren
-        for child in path[-1].children:
-            if child.start >= point:
-                break
-            if child.name == 'error' and child.text in ['(', '[', '{', '"']:
-                node = child
-                first_form = None
-            elif first_form is None:
-                first_form = child
-
-        # try indent relative to wrapping paren
-        if not node:
-            for n in reversed(path):
-                if n.name in ['string', 'parens', 'braces', 'brackets']:
-                    node = n
-                    first_form = node.body.children[0] if node.body and node.body.children else None
-                    break
-
-        # top level
-        if not node:
-            row, _ = view.rowcol(point)
-            return ('top-level', row, 0)
-
-        row, col = view.rowcol(node.open.end if node.open else node.end)
-        offset = 0
-        if node.name == 'string':
-            return ('string', row, col)
-        elif node.name == 'parens' or (node.name == 'error' and node.text == '('):
-            # no first form -- indent to paren 
-            if not first_form:
-                offset = 0
-            # first form is a list/map/vector -- indent to paren
-            elif first_form.end <= point and first_form.name in ['parens', 'braces', 'brackets']:
-                offset = 0
-            # form itself is a reader conditional
-            elif node.open and node.open.text in ['#?(', '#?@(']:
-                offset = 0
-            else:
-                offset = 1
-        return ('indent', row, col + offset)
+    Given point, returns (tag, row, indent) for that line, see cs_reindent.indent_at.
+    Without parsed tree, parses only enclosing top-level form
+    """
+    if parsed:
+        return cs_reindent.indent_at(parsed, point, cs_snapshot.snapshot(view).rowcol)
+    start, _, parsed = cs_reindent.top_level_context(lambda begin, end: view.substr(sublime.Region(begin, end)), point, cs_parser.parse)
+    return cs_reindent.indent_at(parsed, point - start, lambda point: view.rowcol(start + point))
 
 def skip_spaces(view, point):
     """
     Starting from point, skips as much spaces as it can without going to the new line,
-    and returns new point
+    and returns new point. Reads one line, not the whole buffer: called on every Enter
     """
-    def is_space(point):
-        s = view.substr(sublime.Region(point, point + 1))
-        return s.isspace() and s not in ['\n', '\r']    
-    while point < view.size() and is_space(point):
-        point = point + 1
-    return point
+    line = view.substr(sublime.Region(point, view.line(point).end()))
+    return cs_reindent.skip_spaces(line, 0) + point
 
 def indent_lines(view, selections, edit):
     """
     Given set of sorted ranges (`selections`), indents all lines touched by those selections
     """
-    # Calculate all replacements first
-    parsed = cs_parser.parse(view.substr(sublime.Region(0, view.size())) + ' ')
-    replacements = {} # row -> (begin, delta_i)
-    for sel in selections:
-        for line in view.lines(sel):
-            begin = line.begin()
-            end   = skip_spaces(view, begin)
-            # do not touch empty lines
-            if end == line.end():
-                continue
-            row, _ = view.rowcol(begin)
-            type, base_row, i = indent(view, begin, parsed)
-            # do not re-indent multiline strings
-            if type == 'string':
-                continue
-            # if we moved line before and depend on it, take that into account
-            _, base_delta_i = replacements.get(base_row, (0, 0))
-            delta_i = i - (end - begin) + base_delta_i
-            if delta_i != 0:
-                replacements[row] = (begin, delta_i)
-
-    # Now apply all replacements, recalculating begins as we go
-    change_id = view.change_id()
-    for row in replacements:
-        begin, delta_i = replacements[row]
-        begin = view.transform_region_from(sublime.Region(begin, begin), change_id).begin()
+    # Calculate all replacements first, in one pass over the tree
+    snapshot = cs_snapshot.snapshot(view)
+    parsed = cs_parser.parse(snapshot.text + ' ')
+    begins = sorted({begin for sel in selections for begin in snapshot.line_begins(sel.begin(), sel.end())})
+    replacements = cs_reindent.reindent(snapshot, parsed, begins)
+    apply_replacements(view, edit, replacements.values())
+
+def apply_replacements(view, edit, replacements):
+    """
+    Applies (begin, delta) pairs from cs_reindent.reindent, touching only
+    leading whitespace of changed lines. Goes bottom-up, so offsets computed
+    before the edit stay valid
+    """
+    for begin, delta_i in sorted(replacements, reverse = True):
         if delta_i < 0:
             view.replace(edit, sublime.Region(begin, begin - delta_i), "")
         else:
             view.replace(edit, sublime.Region(begin, begin), " " * delta_i)
 
+class FormatJob:
+    """
+    Reindents buffer snapshot on a worker thread. Result can be waited for
+    with a timeout, or passed to a callback on UI thread once ready
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.replacements = None
+        self.callback = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        threading.Thread(daemon = True, target = self.run).start()
+
+    def run(self):
+        try:
+            parsed = cs_parser.parse(self.snapshot.text + ' ')
+            self.replacements = cs_reindent.reindent(self.snapshot, parsed, self.snapshot.line_starts())
+        except Exception:
+            cs_common.error("Formatting {} chars", self.snapshot.size())
+            self.replacements = {}
+        with self.lock:
+            self.done.set()
+            callback = self.callback
+        if callback:
+            sublime.set_timeout(callback)
+
+    def wait(self, timeout):
+        return self.done.wait(timeout)
+
+    def then(self, callback):
+        with self.lock:
+            if not self.done.is_set():
+                self.callback = callback
+                return
+        sublime.set_timeout(callback)
+
+def apply_format(view, job):
+    """
+    Applies finished FormatJob as a single edit. Returns False if buffer
+    has changed since snapshot was taken
+    """
+    if not view.is_valid() or view.change_id() != job.snapshot.change_id:
+        return False
+    if job.replacements:
+        view.run_command('clojure_sublimed_apply_indent', {'replacements': list(job.replacements.values())})
+    return True
+
+# views saved again after formatting in background: their next save is already formatted
+resaving = set()
+
 class ClojureSublimedReindentBufferOnSave(sublime_plugin.EventListener):
     def on_pre_save(self, view):
         if cs_common.setting("format_on_save", False) and view.syntax().name == 'Clojure (Sublimed)':
-            view.run_command('clojure_sublimed_reindent_buffer')
+            if view.id() in resaving:
+                resaving.discard(view.id())
+                return
+            start = time.time()
+            job = FormatJob(cs_snapshot.snapshot(view))
+            size = job.snapshot.size()
+            max_size = cs_common.setting("format_on_save_max_size", 1000000)
+            budget_ms = cs_common.setting("format_on_save_budget_ms", 200)
+            if (max_size is None or size <= max_size) and job.wait(budget_ms / 1000):
+                apply_format(view, job)
+                cs_common.debug("{:.2f} ms Format on save {} chars, {} lines changed", (time.time() - start) * 1000, size, len(job.replacements))
+            else:
+                cs_common.debug("{:.2f} ms Format on save {} chars, over budget, continuing in background", (time.time() - start) * 1000, size)
+                job.then(lambda: self.on_background_format(view, job, start))
+
+    def on_background_format(self, view, job, start):
+        if not apply_format(view, job):
+            cs_common.debug("{:.2f} ms Format on save {} chars, buffer changed, skipped", (time.time() - start) * 1000, job.snapshot.size())
+        elif job.replacements:
+            cs_common.debug("{:.2f} ms Format on save {} chars, {} lines changed, saving again", (time.time() - start) * 1000, job.snapshot.size(), len(job.replacements))
+            resaving.add(view.id())
+            view.run_command('save')
+
+def reindent_range(view, begin, end):
+    """
+    Reindents lines that start within [begin, end] (and the first line too,
+    if only whitespace precedes begin). Parses from the start of enclosing
+    top-level form to the end of the range, not the whole buffer.
+    Returns [(begin, delta), ...] in buffer offsets
+    """
+    first_line = view.line(begin)
+    last_line = view.line(end)
+    start, _, _ = cs_reindent.top_level_context(lambda b, e: view.substr(sublime.Region(b, e)), first_line.begin(), cs_parser.parse)
+    text = view.substr(sublime.Region(start, last_line.end()))
+    snapshot = cs_snapshot.Snapshot(text)
+    parsed = cs_parser.parse(text + ' ')
+    # line that starts right at end (range ends with newline) wasn’t pasted
+    begins = [b for b in snapshot.line_begins(first_line.begin() - start, end - start)
+              if (b + start >= begin or text[b:begin - start].isspace()) and (b + start < end or b + start == begin)]
+    replacements = cs_reindent.reindent(snapshot, parsed, begins)
+    return [(b + start, delta) for b, delta in replacements.values()]
+
+class Paste:
+    """
+    Paste in progress: text changes it made, and whether paste command returned.
+    Text changes and on_post_text_command can come in any order
+    """
+    def __init__(self, view):
+        self.view = view
+        self.changes = [] # [(begin, end, inserted length)]
+        self.done = False
+
+    def cancel(self):
+        """
+        Forget paste that changed nothing (empty clipboard, read-only view),
+        so that next ordinary edit isn’t reindented as pasted
+        """
+        if pastes.get(self.view.buffer_id()) is self:
+            del pastes[self.view.buffer_id()]
+
+    def finish(self):
+        if pastes.get(self.view.buffer_id()) is not self:
+            return
+        del pastes[self.view.buffer_id()]
+        ranges = cs_reindent.inserted_ranges(self.changes)
+        with cs_common.Measure("Reindent on paste {} chars", sum(end - begin for begin, end in ranges)):
+            replacements = []
+            for begin, end in ranges:
+                replacements += reindent_range(self.view, begin, end)
+            if replacements:
+                self.view.run_command('clojure_sublimed_apply_indent', {'replacements': replacements})
+
+# buffer id -> Paste
+pastes = {}
+
+# how long to wait for text changes after paste command returned
+paste_changes_timeout_ms = 100
+
+class ClojureSublimedReindentOnPaste(sublime_plugin.EventListener):
+    def enabled(self, view):
+        return cs_common.setting("reindent_on_paste", False) and view.syntax() and view.syntax().name == 'Clojure (Sublimed)'
+
+    def on_text_command(self, view, command_name, args):
+        if command_name == 'paste' and self.enabled(view):
+            pastes[view.buffer_id()] = Paste(view)
+        elif paste := pastes.get(view.buffer_id()):
+            paste.cancel()
+
+    def on_post_text_command(self, view, command_name, args):
+        if command_name == 'paste' and (paste := pastes.get(view.buffer_id())):
+            paste.done = True
+            if paste.changes:
+                paste.finish()
+            else:
+                sublime.set_timeout(lambda: paste.changes or paste.cancel(), paste_changes_timeout_ms)
+
+class ClojureSublimedPasteChangeListener(sublime_plugin.TextChangeListener):
+    """
+    Collects exact ranges inserted by paste. Cursor positions after paste
+    don’t tell them: e.g. whole-line paste inserts above current line and
+    leaves cursor where it was
+    """
+    @classmethod
+    def is_applicable(cls, buffer):
+        return True
+
+    def on_text_changed(self, changes):
+        if paste := pastes.get(self.buffer.id()):
+            paste.changes += [(change.a.pt, change.b.pt, len(change.str)) for change in changes]
+            if paste.done:
+                sublime.set_timeout(paste.finish)
+
+class ClojureSublimedApplyIndentCommand(sublime_plugin.TextCommand):
+    """
+    Applies [[begin, delta], ...] computed by cs_reindent.reindent in one edit
+    """
+    def run(self, edit, replacements):
+        apply_replacements(self.view, edit, replacements)
 
 class ClojureSublimedReindentBufferCommand(sublime_plugin.TextCommand):
     def run(self, edit):
@@ -140,10 +232,11 @@ class ClojureSublimedInsertNewlineCommand(sublime_plugin.TextCommand):
         
         # Calculate all replacements first
         replacements = []
-        for sel in view.sel():
-            end = skip_spaces(view, sel.end())
-            _, _, i = indent(view, sel.begin())
-            replacements.append((sublime.Region(sel.begin(), end), "\n" + " " * i))
+        with cs_common.Measure("Insert Newline {}", view.sel()):
+            for sel in view.sel():
+                end = skip_spaces(view, sel.end())
+                _, _, i = indent(view, sel.begin())
+                replacements.append((sublime.Region(sel.begin(), end), "\n" + " " * i))
 
         # Now apply them all at once
         change_id_sel = view.change_id()
@@ -0,0 +1,89 @@
+import bisect, threading
+
+class IntervalIndex:
+    """
+    Set of [begin, end] intervals with keys, sorted by begin.
+    Overlap queries cost O(log n + k). Doesn’t depend on Sublime, so that
+    region queries don’t need a `view.get_regions` call per interval
+    """
+    def __init__(self):
+        self.begins  = [] # sorted
+        self.ends    = []
+        self.keys    = []
+        self.starts  = {} # key -> begin
+        self.max_len = 0  # upper bound of end - begin
+        self.lock    = threading.RLock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.starts
+
+    def position(self, key):
+        begin = self.starts[key]
+        i = bisect.bisect_left(self.begins, begin)
+        while self.keys[i] != key:
+            i += 1
+        return i
+
+    def get(self, key):
+        """
+        (begin, end) for key or None
+        """
+        with self.lock:
+            if key in self.starts:
+                i = self.position(key)
+                return (self.begins[i], self.ends[i])
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.starts:
+                i = self.position(key)
+                del self.begins[i]
+                del self.ends[i]
+                del self.keys[i]
+                del self.starts[key]
+                if not self.keys:
+                    self.max_len = 0
+
+    def set(self, key, begin, end):
+        """
+        Add new interval or move existing one
+        """
+        with self.lock:
+            self.remove(key)
+            i = bisect.bisect_right(self.begins, begin)
+            self.begins.insert(i, begin)
+            self.ends.insert(i, end)
+            self.keys.insert(i, key)
+            self.starts[key] = begin
+            self.max_len = max(self.max_len, end - begin)
+
+    def query(self, begin, end):
+        """
+        Keys of all intervals that intersect or touch [begin, end], in order
+        """
+        with self.lock:
+            lo = bisect.bisect_left(self.begins, begin - self.max_len)
+            hi = bisect.bisect_right(self.begins, end)
+            return [self.keys[i] for i in range(lo, hi) if self.ends[i] >= begin]
+
+    def replace(self, begin, end, length):
+        """
+        Update index after text in [begin, end) was replaced with `length` chars.
+        Intervals strictly after the change are shifted, those before are kept.
+        Intervals touching the change are removed and their keys returned:
+        their new position can’t be inferred and should be re-read from the view
+        """
+        with self.lock:
+            touched = self.query(begin, end)
+            for key in touched:
+                self.remove(key)
+            delta = length - (end - begin)
+            if delta != 0:
+                for i in range(bisect.bisect_right(self.begins, end), len(self.keys)):
+                    self.begins[i] += delta
+                    self.ends[i] += delta
+                    self.starts[self.keys[i]] = self.begins[i]
+            return touched
@@ -378,16 +378,85 @@ def search(node, pos, pred = lambda x: True, max_depth = 1000):
         elif pos < child.start:
             break
 
+def unwrap_meta(node):
+    while node.name == 'meta' and node.body:
+        node = node.body.children[0]
+    return node
+
+def form_key(node, string):
+    """
+    Identity of top-level form that survives edits of its body:
+    head + name for def-like forms and ns ('defn foo', 'defmethod area :square'),
+    form text for everything else
+    """
+    form = unwrap_meta(node)
+    if form.name == 'parens' and form.body and len(form.body.children) >= 2:
+        head = form.body.children[0]
+        name = unwrap_meta(form.body.children[1])
+        if is_symbol(head) and (head.text == 'ns' or head.text.startswith('def')) and is_symbol(name):
+            key = head.text + ' ' + name.text
+            if head.text == 'defmethod' and len(form.body.children) >= 3:
+                dispatch = form.body.children[2]
+                key += ' ' + string[dispatch.start:dispatch.end]
+            return key
+    return string[node.start:node.end]
+
+def defined_namespace(node):
+    """
+    Namespace name if node is `(ns name ...)` or `(in-ns 'name)`, None otherwise
+    """
+    if node.name == 'parens':
+        body = node.body
+        if len(body.children) >= 2:
+            first_form = body.children[0]
+            if first_form.name == 'token' and first_form.text == 'ns':
+                second_form = unwrap_meta(body.children[1])
+                if is_symbol(second_form):
+                    return second_form.text
+            elif first_form.name == 'token' and first_form.text == 'in-ns':
+                second_form = body.children[1]
+                if second_form.name == 'wrap' and second_form.marker.text == "'":
+                    unwrapped = second_form.body.children[0]
+                    if is_symbol(unwrapped):
+                        return unwrapped.text
+
+def namespaces(parsed):
+    """
+    {start: namespace} for each top-level node: last namespace defined before it, or None
+    """
+    res = {}
+    ns = None
+    for child in parsed.children:
+        res[child.start] = ns
+        ns = defined_namespace(child) or ns
+    return res
+
+def top_level_forms(parsed):
+    return [child for child in parsed.children if child.name not in {'comment', 'discard'}]
+
+def changed_forms(parsed, string, loaded):
+    """
+    Top-level forms whose text differs from what was last loaded
+    under the same key. `loaded` is {form_key: hash(text)}
+    """
+    return [form for form in top_level_forms(parsed)
+            if loaded.get(form_key(form, string)) != hash(string[form.start:form.end])]
+
 if __package__:
     import sublime, sublime_plugin
+    from . import cs_snapshot
 
 def parse_tree(view, region = None):
     """
-    Parses current buffer content and return AST
+    Parses current buffer content and return AST.
+    Whole-buffer parse is cached until buffer changes
     """
-    id = view.buffer_id()
-    text = view.substr(region or sublime.Region(0, view.size()))
-    return parse(text)
+    if region:
+        return parse(view.substr(region))
+    snapshot = cs_snapshot.snapshot(view)
+    if snapshot.parsed is None:
+        snapshot.parsed = parse(snapshot.text)
+    return snapshot.parsed
 
 def symbol_at_point(view, point):
     """
@@ -405,8 +474,9 @@ def topmost_form(view, point):
     """
 
     # move left to first non-space
-    if point >= view.size() or view.substr(sublime.Region(point, point + 1)).isspace():
-        while point > 0 and view.substr(sublime.Region(point - 1, point)).isspace():
+    text = cs_snapshot.snapshot(view).text
+    if point >= len(text) or text[point].isspace():
+        while point > 0 and text[point - 1].isspace():
             point = point - 1
 
     parsed = parse_tree(view)
@@ -428,23 +498,7 @@ def namespace(view, point):
     for child in parsed.children:
         if child.end >= point:
             break
-        elif child.name == 'parens':
-            body = child.body
-            if len(body.children) >= 2:
-                first_form = body.children[0]
-                if first_form.name == 'token' and first_form.text == 'ns':
-                    second_form = body.children[1]
-                    while second_form.name == 'meta' and second_form.body:
-                        second_form = second_form.body.children[0]
-                    if is_symbol(second_form):
-                        ns = second_form.text
-                elif first_form.name == 'token' and first_form.text == 'in-ns':
-                    second_form = body.children[1]
-                    print(second_form.name, second_form.marker.text)
-                    if second_form.name == 'wrap' and second_form.marker.text == "'":
-                        unwrapped = second_form.body.children[0]
-                        if is_symbol(unwrapped):
-                            ns = unwrapped.text
+        ns = defined_namespace(child) or ns
     return ns
 
 def plugin_unloaded():
@@ -9,87 +9,178 @@ def safe_get(l, i, default = None):
     else:
         return default
 
-def format_map(text, node, indent, limit):
+class Doc:
+    """
+    Formatted fragment: a tree of string chunks, plus total length and
+    whether it spans several lines. Layout decisions only need these two,
+    so nothing is re-measured or copied: adding a fragment is O(1),
+    flattening the whole tree at the end is O(n).
+    Leaf fragments are kept as plain strings
+    """
+    __slots__ = ('parts', 'length', 'multiline')
+
+    def __init__(self, parts, length, multiline):
+        self.parts = parts
+        self.length = length
+        self.multiline = multiline
+
+    def chunks(self):
+        """
+        Yields string chunks in order, without recursion
+        """
+        stack = [iter(self.parts)]
+        while stack:
+            for part in stack[-1]:
+                if part.__class__ is str:
+                    yield part
+                else:
+                    stack.append(iter(part.parts))
+                    break
+            else:
+                stack.pop()
+
+    def __str__(self):
+        return ''.join(self.chunks())
+
+def measure(doc):
+    """
+    (length, multiline) of Doc or str
+    """
+    if doc.__class__ is str:
+        return (len(doc), '\n' in doc)
+    return (doc.length, doc.multiline)
+
+# fragments shorter than this are joined into plain strings right away:
+# cheaper than keeping a tree of tiny chunks, and total work stays linear
+flat_limit = 256
+
+def make_doc(parts):
+    """
+    Doc from parts, or str if it’s short
+    """
+    length = 0
+    multiline = False
+    for part in parts:
+        if part.__class__ is str:
+            length += len(part)
+            multiline = multiline or '\n' in part
+        else:
+            length += part.length
+            multiline = multiline or part.multiline
+    if length <= flat_limit:
+        return ''.join(parts)
+    return Doc(parts, length, multiline)
+
+def map_parts(text, node, indent, limit):
     """
     Puts key-value pairs on separate line each. Aligns keys by longest one:
     {:a 1 :bbb 2 :cc 3} => {:a   1
                             :bbb 2
                             :cc  3}
+    Yields parts (str or Doc). Keys are laid out upfront, values one by one
     """
-    res = node.open.text
-    indent_keys = indent + len(node.open.text) * ' '
+    open, body, close = node.open.text, node.body, node.close
+    yield open
+    indent_keys = indent + len(open) * ' '
+    newline = '\n' + indent_keys
     keys = []
     vals = []
-    if node.body:
-        idxs = range(0, len(node.body.children), 2)
-        keys = [node.body.children[i] for i in idxs]
-        vals = [safe_get(node.body.children, i + 1) for i in idxs]
-    key_strings = [format(text, k, indent_keys, limit) for k in keys]
-    longest_key = max(len(ks) for ks in key_strings) if key_strings else 0
-    indent_vals = indent_keys + longest_key * ' ' + ' '
-    for i, ks, v in zip(range(0, len(keys)), key_strings, vals):
+    if body:
+        children = body.children
+        idxs = range(0, len(children), 2)
+        keys = [children[i] for i in idxs]
+        vals = [safe_get(children, i + 1) for i in idxs]
+    key_docs = [layout(text, k, indent_keys, limit) for k in keys]
+    key_lengths = [measure(kd)[0] for kd in key_docs]
+    longest_key = max(key_lengths) if key_lengths else 0
+    for i, kd, kl, v in zip(range(0, len(keys)), key_docs, key_lengths, vals):
         if i > 0:
-            res += '\n' + indent_keys
-        res += ks
+            yield newline
+        yield kd
         if v is not None:
-            vs = format(text, v, indent_keys, limit)
-            if '\n' in vs:
-                res += '\n' + indent_keys + vs
-            elif len(indent_keys) + longest_key + 1 + len(vs) <= limit:
-                res += (longest_key - len(ks)) * ' ' + ' ' + vs
-            elif len(indent_keys) + len(ks) + 1 + len(vs) <= limit:
-                res += ' ' + vs
+            vd = layout(text, v, indent_keys, limit)
+            vl, vm = measure(vd)
+            if vm:
+                yield newline
+            elif len(indent_keys) + longest_key + 1 + vl <= limit:
+                yield (longest_key - kl) * ' ' + ' '
+            elif len(indent_keys) + kl + 1 + vl <= limit:
+                yield ' '
             else:
-                res += '\n' + indent_keys + vs
-    if node.close:
-        res += node.close.text
-    return res
+                yield newline
+            yield vd
+    if close:
+        yield close.text
 
-def format_list(text, node, indent, limit):
+def list_parts(text, node, indent, limit, stream = False):
     """
     Everythin list-like: (...), [...], #{...}
     Puts as many children as it can on a line, then starts new one.
+    Yields parts (str or Doc). With stream = True, nested collections are
+    yielded chunk by chunk as they are laid out instead of as a single Doc
     """
-    indent_children = indent + (len(node.open.text) * ' ')
-    res = node.open.text
+    open, body, close = node.open.text, node.body, node.close
+    indent_children = indent + (len(open) * ' ')
+    newline = '\n' + indent_children
+    yield open
+    # length of the last line so far. First line is counted from open paren
+    column = len(open)
     force_newline = False
     is_first = True
-    if node.body:
-        for i, child in enumerate(node.body.children):
+    if body:
+        for child in body.children:
             if force_newline:
-                res += '\n' + indent_children
+                yield newline
+                column = len(indent_children)
                 is_first = True
-            
-            child_str = format(text, child, indent_children, limit)
-            if '\n' in child_str or child.name in {'brackets', 'parens', 'braces'} or len(child_str) > limit / 3:
+
+            # collections always go on their own line, no need to measure them first
+            if child.name in {'brackets', 'parens', 'braces'}:
                 if not is_first:
-                    res += '\n' + indent_children
-                res += child_str
+                    yield newline
+                if stream:
+                    yield from layout_chunks(text, child, indent_children, limit)
+                else:
+                    yield layout(text, child, indent_children, limit)
+                force_newline = True
+                is_first = True
+                continue
+            child_doc = layout(text, child, indent_children, limit)
+            child_length, child_multiline = measure(child_doc)
+            if child_multiline or child_length > limit / 3:
+                if not is_first:
+                    yield newline
+                yield child_doc
                 force_newline = True
                 is_first = True
                 continue
-            last_line = res[res.rfind('\n') + 1:]
             separator = '' if is_first else ' '
-            if len(last_line) + len(separator) + len(child_str) > limit:
-                res += '\n' + indent_children + child_str
+            if column + len(separator) + child_length > limit:
+                yield newline
+                column = len(indent_children) + child_length
             else:
-                res += separator + child_str
+                yield separator
+                column += len(separator) + child_length
+            yield child_doc
             force_newline = False
             is_first = False
-    close = node.close.text if node.close else ''
-    res += close
-    return res
+    if close:
+        yield close.text
 
-def format_tagged(text, node, indent, limit):
+def tagged_parts(text, node, indent, limit, stream = False):
     """
     #tag <some_value>
     """
-    tag_string = format(text, node.tag, indent, limit)
-    res = '#' + tag_string
+    tag_doc = layout(text, node.tag, indent, limit)
+    yield '#'
+    yield tag_doc
     if node.body:
-        value_indent = indent + ' ' + len(tag_string) * ' ' + ' '
-        res += ' ' + format(text, node.body.children[0], value_indent, limit)
-    return res
+        value_indent = indent + ' ' + measure(tag_doc)[0] * ' ' + ' '
+        yield ' '
+        if stream:
+            yield from layout_chunks(text, node.body.children[0], value_indent, limit)
+        else:
+            yield layout(text, node.body.children[0], value_indent, limit)
 
 def wrap_string(s, limit = 80, indent = ''):
     space = limit - len(indent)
@@ -98,28 +189,79 @@ def wrap_string(s, limit = 80, indent = ''):
         return s
     if space < 10:
         return s
-    res = ""
-    for start in range(0, length, space):
-        end = min(start + space, length)
-        if start > 0:
-            res += '\n' + indent
-        res += s[start:end]
-    return res
+    return ('\n' + indent).join(s[start:start + space] for start in range(0, length, space))
 
-def format(text, node, indent = '', limit = 80):
+def layout(text, node, indent = '', limit = 80):
     """
-    Given text and its parsed AST as node, returns formatted (pretty-printed) string of that node
+    Given text and its parsed AST as node, returns formatted (pretty-printed) node as Doc or str
     """
     if node.name == 'source':
-        return '\n'.join(format(text, n, '', limit) for n in node.children)
+        parts = []
+        for i, child in enumerate(node.children):
+            if i > 0:
+                parts.append('\n')
+            parts.append(layout(text, child, '', limit))
+        return make_doc(parts)
     elif node.name == 'braces' and node.open.text != '#{':
-        return format_map(text, node, indent, limit)
+        return make_doc(list(map_parts(text, node, indent, limit)))
     elif node.name in {'parens', 'brackets', 'braces'}:
-        return format_list(text, node, indent, limit)
+        return make_doc(list(list_parts(text, node, indent, limit)))
     elif node.name == 'tagged':
-        return format_tagged(text, node, indent, limit)
+        return make_doc(list(tagged_parts(text, node, indent, limit)))
     else:
         str = text[node.start:node.end]
-        str = re.sub("(?<!\\\\)\\\\n", "\n", str)
-        str = "\n".join(wrap_string(s, limit = limit, indent = indent) for s in str.split("\n"))
+        if '\\n' in str:
+            str = re.sub("(?<!\\\\)\\\\n", "\n", str)
+        if len(str) + len(indent) > limit or '\n' in str:
+            str = "\n".join(wrap_string(s, limit = limit, indent = indent) for s in str.split("\n"))
         return str
+
+def format(text, node, indent = '', limit = 80):
+    """
+    Given text and its parsed AST as node, returns formatted (pretty-printed) string of that node
+    """
+    doc = layout(text, node, indent, limit)
+    return doc if doc.__class__ is str else str(doc)
+
+def layout_chunks(text, node, indent = '', limit = 80):
+    """
+    Like layout, but yields string chunks as soon as they are laid out.
+    Children of collections and top-level forms are streamed one by one,
+    nested values that need measuring first are laid out whole
+    """
+    if node.name == 'source':
+        for i, child in enumerate(node.children):
+            if i > 0:
+                yield '\n'
+            yield from layout_chunks(text, child, '', limit)
+        return
+    elif node.name == 'braces' and node.open.text != '#{':
+        parts = map_parts(text, node, indent, limit)
+    elif node.name in {'parens', 'brackets', 'braces'}:
+        parts = list_parts(text, node, indent, limit, stream = True)
+    elif node.name == 'tagged':
+        parts = tagged_parts(text, node, indent, limit, stream = True)
+    else:
+        parts = [layout(text, node, indent, limit)]
+    for part in parts:
+        if part.__class__ is str:
+            yield part
+        else:
+            yield from part.chunks()
+
+def format_lines(text, node, indent = '', limit = 80):
+    """
+    Lazy version of format(...).split('\n'): yields formatted lines one by one,
+    so that caller can stop early without printing the whole value
+    """
+    line = []
+    for chunk in layout_chunks(text, node, indent, limit):
+        if '\n' in chunk:
+            first, *rest = chunk.split('\n')
+            line.append(first)
+            yield ''.join(line)
+            yield from rest[:-1]
+            line = [rest[-1]]
+        else:
+            line.append(chunk)
+    yield ''.join(line)
@@ -12,6 +12,7 @@ class ProgressThread:
         self.phases = None
         self.phase_idx = 0
         self.interval = 100
+        self.batch_size = 20 # every that many visible pending evals slow down animation by interval
 
     def update_phases(self, phases, interval):
         self.phases = phases
@@ -26,16 +27,22 @@ class ProgressThread:
         return self.phases[self.phase_idx]
 
     def run_loop(self):
+        slowdown = 1
         while True:
             if not self.running:
                 break
-            time.sleep(self.interval / 1000.0)
-            updated = False
+            time.sleep(self.interval * slowdown / 1000.0)
+            pending = False
             if (window := sublime.active_window()) and (view := window.active_view()):
-                for eval in cs_eval.by_status(view, 'pending'):
-                    eval.update(eval.status, self.phase())
-                    updated = True
-            if updated:
+                # only animate what’s on screen, but keep going while anything is pending
+                pending = bool(cs_eval.by_status(view, 'pending'))
+                if pending:
+                    visible = [eval for eval in cs_eval.by_range(view, view.visible_region()) if eval.status == 'pending']
+                    for eval in visible:
+                        eval.update(eval.status, self.phase())
+                    # with many spinners on screen, animate slower
+                    slowdown = 1 + len(visible) // self.batch_size
+            if pending:
                 self.phase_idx = (self.phase_idx + 1) % len(self.phases)
             else:
                 with self.condition:
@@ -0,0 +1,63 @@
+import threading
+
+class Registry:
+    """
+    Evals by id and by view id.
+
+    Mutations happen on a single owner thread only: when called from any
+    other thread, they are posted to the owner via `post(fn)`. Readers don’t
+    lock: single lookups are atomic, and iteration goes over snapshots
+    (tuples), so it is safe while the registry changes
+    """
+    def __init__(self, post, owner = None):
+        self.post    = post
+        self.owner   = owner or threading.current_thread()
+        self.by_id   = {} # id -> value
+        self.by_view = {} # view id -> {id -> value}
+
+    def is_owner(self):
+        return threading.current_thread() is self.owner
+
+    def mutate(self, fn):
+        if self.is_owner():
+            fn()
+        else:
+            self.post(fn)
+
+    def add(self, id, view_id, value):
+        def add():
+            self.by_id[id] = value
+            if view_id not in self.by_view:
+                self.by_view[view_id] = {}
+            self.by_view[view_id][id] = value
+        self.mutate(add)
+
+    def remove(self, id, view_id):
+        """
+        Removes id if present, can be called more than once
+        """
+        def remove():
+            self.by_id.pop(id, None)
+            if (view := self.by_view.get(view_id)) is not None:
+                view.pop(id, None)
+                if not view:
+                    del self.by_view[view_id]
+        self.mutate(remove)
+
+    def get(self, id):
+        return self.by_id.get(id)
+
+    def get_in_view(self, view_id, id):
+        if (view := self.by_view.get(view_id)) is not None:
+            return view.get(id)
+
+    def __contains__(self, id):
+        return id in self.by_id
+
+    def values(self):
+        return tuple(self.by_id.values())
+
+    def values_in_view(self, view_id):
+        if (view := self.by_view.get(view_id)) is not None:
+            return tuple(view.values())
+        return ()
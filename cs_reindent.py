@@ -0,0 +1,241 @@
+import re
+
+def skip_spaces(text, point):
+    """
+    Starting from point, skips as much spaces as it can without going to the new line,
+    and returns new point
+    """
+    length = len(text)
+    while point < length and text[point].isspace() and text[point] not in '\n\r':
+        point += 1
+    return point
+
+top_level_re = re.compile(r'\n[ \t]*\n(?=\()')
+
+def top_level_start(text, point):
+    """
+    Start of the last line before point that begins with an open paren and
+    follows a blank line. Most likely a top-level form, which is enough
+    context to indent point without parsing everything before it.
+    -1 if there’s no such line
+    """
+    last = None
+    for last in top_level_re.finditer(text, 0, point):
+        pass
+    if last:
+        return last.end()
+    return 0 if point > 0 and text.startswith('(') else -1
+
+def is_balanced_context(parsed):
+    """
+    False if parsed text has unmatched closing brackets or an unclosed string
+    at top level, meaning it starts inside a form or a string
+    """
+    for child in parsed.children:
+        if child.name == 'error' and child.text in [')', ']', '}']:
+            return False
+        if child.name == 'string' and not child.close:
+            return False
+    return True
+
+def top_level_context(read, point, parse, chunk = 4096):
+    """
+    Returns (start, text, parsed): text from the start of enclosing top-level
+    form up to point, and `parse(text + ' ')`. `read(begin, end)` returns text
+    between offsets. Reads backwards, growing the window 4x each time, so cost
+    depends on the size of the form, not on how far into the file it is.
+    Candidates that turn out to start inside a string or a form (e.g. a blank
+    line followed by an open paren in a docstring) are skipped
+    """
+    size = chunk
+    limit = point # candidates at or after limit were rejected
+    while True:
+        begin = max(0, point - size)
+        text = read(begin, point)
+        while True:
+            start = top_level_start(text, limit - begin)
+            if start < 0 or (start == 0 and begin > 0):
+                break
+            parsed = parse(text[start:] + ' ')
+            if is_balanced_context(parsed):
+                return (begin + start, text[start:], parsed)
+            if start == 0:
+                break
+            limit = begin + start - 1
+        if begin == 0:
+            return (0, text, parse(text + ' '))
+        size *= 4
+
+def search_path(node, pos):
+    """
+    Looks for the deepest node that wraps pos (start < pos < end).
+    Returns full path to that node from the top
+    """
+    res = [node]
+    for child in node.children:
+        if child.start < pos < child.end:
+            res += search_path(child, pos)
+        elif pos < child.start:
+            break
+    return res
+
+def is_unmatched(node):
+    return node.name == 'error' and node.text in ['(', '[', '{', '"']
+
+def is_wrapping(node):
+    return node.name in ['string', 'parens', 'braces', 'brackets']
+
+def resolve(point, node, first_form, rowcol):
+    """
+    Given innermost open paren (node) and first form after it, returns (tag, row, indent)
+    """
+    # top level
+    if not node:
+        row, _ = rowcol(point)
+        return ('top-level', row, 0)
+
+    row, col = rowcol(node.open.end if node.open else node.end)
+    offset = 0
+    if node.name == 'string':
+        return ('string', row, col)
+    elif node.name == 'parens' or (node.name == 'error' and node.text == '('):
+        # no first form -- indent to paren
+        if not first_form:
+            offset = 0
+        # first form is a list/map/vector -- indent to paren
+        elif first_form.end <= point and first_form.name in ['parens', 'braces', 'brackets']:
+            offset = 0
+        # form itself is a reader conditional
+        elif node.open and node.open.text in ['#?(', '#?@(']:
+            offset = 0
+        else:
+            offset = 1
+    return ('indent', row, col + offset)
+
+def first_child(node):
+    return node.body.children[0] if node.body and node.body.children else None
+
+def indent_at(parsed, point, rowcol):
+    """
+    Given point, returns (tag, row, indent) for that line, where indent
+    is a correct indent based on the last unclosed paren before point.
+
+    Tag could be 'string' (don't change anything, we're inside string),
+    'top-level' (set to 0, we are at top level) or 'indent' (normal behaviour)
+
+    Row is row number of the token for which this indent is based on (row of open paren)
+    """
+    path = search_path(parsed, point)
+    node = None
+    first_form = None
+
+    # try finding unmatched open paren
+    for child in path[-1].children:
+        if child.start >= point:
+            break
+        if is_unmatched(child):
+            node = child
+            first_form = None
+        elif first_form is None:
+            first_form = child
+
+    # try indent relative to wrapping paren
+    if not node:
+        for n in reversed(path):
+            if is_wrapping(n):
+                node = n
+                first_form = first_child(node)
+                break
+
+    return resolve(point, node, first_form, rowcol)
+
+def indent_all(parsed, points, rowcol):
+    """
+    Same as [indent_at(parsed, point, rowcol) for point in points], but in
+    a single depth-first pass over the tree. Points must be sorted
+    """
+    res = []
+
+    def walk(node, wrapping, i, end):
+        # innermost unmatched open paren among children passed so far
+        unmatched = None
+        first_form = None
+
+        def resolve_here(point):
+            if unmatched:
+                return resolve(point, unmatched, first_form, rowcol)
+            elif wrapping:
+                return resolve(point, wrapping, first_child(wrapping), rowcol)
+            else:
+                return resolve(point, None, None, rowcol)
+
+        for child in node.children:
+            # points between children belong to this node
+            while i < len(points) and points[i] <= child.start:
+                res.append(resolve_here(points[i]))
+                i += 1
+            # points strictly inside child
+            if i < len(points) and points[i] < child.end:
+                i = walk(child, child if is_wrapping(child) else wrapping, i, child.end)
+            if is_unmatched(child):
+                unmatched = child
+                first_form = None
+            elif first_form is None:
+                first_form = child
+        while i < len(points) and points[i] < end:
+            res.append(resolve_here(points[i]))
+            i += 1
+        return i
+
+    walk(parsed, parsed if is_wrapping(parsed) else None, 0, float('inf'))
+    return res
+
+def reindent(snapshot, parsed, begins):
+    """
+    Given cs_snapshot.Snapshot and sorted line begins, returns {row: (begin, delta)}:
+    how many spaces to add (or remove, if negative) at the beginning of each line.
+    Empty lines and lines inside multiline strings are skipped
+    """
+    text = snapshot.text
+    lines = []
+    for begin in begins:
+        end = skip_spaces(text, begin)
+        # do not touch empty lines
+        if end < len(text) and text[end] != '\n':
+            lines.append((begin, end))
+    indents = indent_all(parsed, [begin for begin, _ in lines], snapshot.rowcol)
+    replacements = {} # row -> (begin, delta_i)
+    for (begin, end), (type, base_row, i) in zip(lines, indents):
+        # do not re-indent multiline strings
+        if type == 'string':
+            continue
+        row = snapshot.row(begin)
+        # if we moved line before and depend on it, take that into account
+        _, base_delta_i = replacements.get(base_row, (0, 0))
+        delta_i = i - (end - begin) + base_delta_i
+        if delta_i != 0:
+            replacements[row] = (begin, delta_i)
+    return replacements
+
+def inserted_ranges(changes):
+    """
+    Given text changes in the order they were applied, as (begin, end, inserted
+    length) in offsets at the time of each change, returns sorted (begin, end)
+    of inserted text in offsets after all changes. Later changes shift ranges
+    inserted before them
+    """
+    res = []
+    for begin, end, length in changes:
+        delta = length - (end - begin)
+        shifted = []
+        for b, e in res:
+            if e <= begin:
+                shifted.append((b, e))
+            elif b >= end:
+                shifted.append((b + delta, e + delta))
+            else: # overlaps replaced text
+                shifted.append((min(b, begin), max(e + delta, begin + length)))
+        res = shifted
+        if length > 0:
+            res.append((begin, begin + length))
+    return sorted(res)
@@ -0,0 +1,71 @@
+import heapq, itertools, threading
+
+class Scheduler:
+    """
+    Evals waiting to be sent, ordered by priority (lower goes first), then
+    FIFO, and ids that were sent but aren’t done yet.
+
+    `limit()` is max ids in flight (0 or None: unlimited). `alive(id)` is
+    False for ids that were erased while in queue: those are not sent,
+    `drop(id)` is called instead, so whoever waits for them can move on.
+    `start(id, send)` is called when id leaves the queue. Both callbacks
+    run outside of the lock, so they can schedule more
+    """
+    def __init__(self, limit, alive, start, drop):
+        self.limit     = limit
+        self.alive     = alive
+        self.start     = start
+        self.drop      = drop
+        self.lock      = threading.Lock()
+        self.queue     = [] # heap of (priority, seq, id, send)
+        self.seq       = itertools.count()
+        self.in_flight = set()
+
+    def push(self, id, send, priority):
+        with self.lock:
+            heapq.heappush(self.queue, (priority, next(self.seq), id, send))
+
+    def is_queued(self, id):
+        """
+        Call under `lock`
+        """
+        return any(id == item[2] for item in self.queue)
+
+    def dispatch(self):
+        """
+        Start as many queued ids as limit allows. Returns False if something
+        is still queued
+        """
+        limit = self.limit()
+        while True:
+            with self.lock:
+                if not self.queue:
+                    return True
+                if limit and len(self.in_flight) >= limit:
+                    return False
+                _, _, id, send = heapq.heappop(self.queue)
+                alive = self.alive(id)
+                if alive:
+                    self.in_flight.add(id)
+            if alive:
+                self.start(id, send)
+            else:
+                self.drop(id)
+
+    def done(self, id):
+        """
+        Frees a slot taken by id. Returns False if id wasn’t in flight
+        """
+        with self.lock:
+            if id not in self.in_flight:
+                return False
+            self.in_flight.discard(id)
+        return True
+
+    def is_in_flight(self, id):
+        return id in self.in_flight
+
+    def clear(self):
+        with self.lock:
+            self.queue.clear()
+            self.in_flight.clear()
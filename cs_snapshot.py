@@ -0,0 +1,112 @@
+import bisect, collections, itertools, operator
+
+# Sublime API calls made through snapshots and queries answered without them,
+# by name. Read by cs_common.Measure
+calls = collections.Counter()
+
+class Snapshot:
+    """
+    Buffer text captured once, plus a line start table. Answers position
+    queries in-process, so callers don’t need a view.substr / view.rowcol
+    round-trip per query (or per char). Doesn’t depend on Sublime
+    """
+    def __init__(self, text, change_id = None):
+        self.text      = text
+        self.change_id = change_id
+        self.starts    = None # line start offsets, computed lazily
+        self.parsed    = None # set by cs_parser.parse_tree
+
+    def size(self):
+        return len(self.text)
+
+    def line_starts(self):
+        """
+        Offsets of the first char of every line
+        """
+        if self.starts is None:
+            lengths = map(operator.add, map(len, self.text.split('\n')), itertools.repeat(1))
+            self.starts = list(itertools.accumulate(lengths, initial = 0))[:-1]
+        return self.starts
+
+    def substr(self, begin, end):
+        calls['substr (local)'] += 1
+        return self.text[begin:end]
+
+    def char(self, point):
+        return self.text[point:point + 1]
+
+    def row(self, point):
+        return bisect.bisect_right(self.line_starts(), point) - 1
+
+    def rowcol(self, point):
+        """
+        Same as view.rowcol
+        """
+        calls['rowcol (local)'] += 1
+        row = self.row(point)
+        return (row, point - self.line_starts()[row])
+
+    def rowcol_utf16(self, point):
+        """
+        Same as view.rowcol_utf16: column in UTF-16 code units
+        """
+        calls['rowcol_utf16 (local)'] += 1
+        row = self.row(point)
+        prefix = self.text[self.line_starts()[row]:point]
+        if prefix.isascii():
+            return (row, len(prefix))
+        return (row, len(prefix.encode('utf-16-le')) // 2)
+
+    def line(self, point):
+        """
+        (begin, end) of line containing point, without newline. Same as view.line
+        """
+        calls['line (local)'] += 1
+        starts = self.line_starts()
+        row = self.row(point)
+        end = starts[row + 1] - 1 if row + 1 < len(starts) else len(self.text)
+        return (starts[row], end)
+
+    def line_begins(self, begin, end):
+        """
+        Begins of all lines touched by [begin, end]. Same as [l.begin() for l in view.lines(region)]
+        """
+        calls['lines (local)'] += 1
+        starts = self.line_starts()
+        return starts[self.row(begin):self.row(end) + 1]
+
+if __package__:
+    import sublime
+
+# buffer id -> Snapshot, for last few buffers used
+snapshots = collections.OrderedDict()
+max_snapshots = 8
+
+def snapshot(view):
+    """
+    Snapshot of view text. Reused until buffer changes
+    """
+    calls['change_id'] += 1
+    change_id = view.change_id()
+    key = view.buffer_id()
+    snap = snapshots.get(key)
+    if snap is None or snap.change_id != change_id:
+        calls['substr'] += 1
+        snap = Snapshot(view.substr(sublime.Region(0, view.size())), change_id)
+        snapshots[key] = snap
+        while len(snapshots) > max_snapshots:
+            snapshots.popitem(last = False)
+    snapshots.move_to_end(key)
+    return snap
+
+def line(view, x):
+    """
+    view.line(point or region) answered from snapshot
+    """
+    snap = snapshot(view)
+    if isinstance(x, sublime.Region):
+        return sublime.Region(snap.line(x.begin())[0], snap.line(x.end())[1])
+    return sublime.Region(*snap.line(x))
+
+def plugin_unloaded():
+    snapshots.clear()
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+"""
+Headless comparison of eval lookups by region: linear scan with one
+`view.get_regions` call per eval (old cs_eval.by_region) vs IntervalIndex
+"""
+import os, random, sys, time
+
+cwd = os.path.abspath(os.path.dirname(__file__))
+os.chdir(cwd + "/..")
+sys.path.append(os.getcwd())
+import cs_intervals
+
+class FakeView:
+    """
+    Counts API calls the way cs_eval makes them
+    """
+    def __init__(self):
+        self.regions = {}
+        self.calls = 0
+
+    def get_regions(self, key):
+        self.calls += 1
+        return [self.regions[key]] if key in self.regions else []
+
+def touch(a, b):
+    return a is not None and not a[1] < b[0] and not a[0] > b[1]
+
+def bench(n, queries = 1000):
+    view = FakeView()
+    index = cs_intervals.IntervalIndex()
+    for id in range(n):
+        begin = id * 20
+        view.regions[id] = (begin, begin + 15)
+        index.set(id, begin, begin + 15)
+    points = [random.randint(0, n * 20) for _ in range(queries)]
+
+    start = time.perf_counter()
+    view.calls = 0
+    for point in points:
+        for id in view.regions:
+            if touch((regions := view.get_regions(id)) and regions[0], (point, point)):
+                break
+    linear_time = time.perf_counter() - start
+    linear_calls = view.calls
+
+    start = time.perf_counter()
+    view.calls = 0
+    for point in points:
+        for id in index.query(point, point):
+            if touch((regions := view.get_regions(id)) and regions[0], (point, point)):
+                break
+    index_time = time.perf_counter() - start
+    index_calls = view.calls
+
+    start = time.perf_counter()
+    for point in points:
+        for id in index.replace(point, point, 1):
+            index.set(id, *view.regions[id])
+    edit_time = time.perf_counter() - start
+
+    print("{:>6} evals: linear {:8.3f} ms/query {:>6} calls/query | index {:.3f} ms/query {:.1f} calls/query | keystroke {:.3f} ms".format(
+        n,
+        linear_time / queries * 1000, linear_calls // queries,
+        index_time / queries * 1000, index_calls / queries,
+        edit_time / queries * 1000))
+
+if __name__ == '__main__':
+    bench(1000)
+    bench(10000, queries = 100)
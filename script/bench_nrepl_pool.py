@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+"""
+Compares eval round-trip latency of a tiny form in a freshly cloned session
+(what clone-eval-close does) vs in a pre-cloned session (session_pool_size > 0).
+
+Start nREPL with script/nrepl.py, then run:
+
+    script/bench_nrepl_pool.py [host:port] [iterations]
+
+Address defaults to localhost:<port from .nrepl-port>
+"""
+import os, socket, sys, time
+
+cwd = os.path.abspath(os.path.dirname(__file__))
+os.chdir(cwd + "/..")
+sys.path.append(os.getcwd())
+import cs_bencode
+
+class Client:
+    def __init__(self, addr):
+        host, port = addr.rsplit(':', 1)
+        self.socket = socket.create_connection((host, int(port)))
+        self.file = self.socket.makefile('rb')
+        self.next_id = 0
+
+    def request(self, msg):
+        """
+        Sends msg, returns all responses up to 'done' status
+        """
+        self.next_id += 1
+        id = str(self.next_id)
+        self.socket.sendall(cs_bencode.encode({**msg, 'id': id}).encode())
+        responses = []
+        for resp in cs_bencode.decode_file(self.file):
+            if resp.get('id') == id:
+                responses.append(resp)
+                if 'done' in resp.get('status', []):
+                    break
+        return responses
+
+    def clone(self, session = None):
+        msg = {'op': 'clone'}
+        if session:
+            msg['session'] = session
+        return next(resp['new-session'] for resp in self.request(msg) if 'new-session' in resp)
+
+    def eval(self, session, code):
+        return self.request({'op': 'eval', 'session': session, 'code': code})
+
+    def close(self, session):
+        self.request({'op': 'close', 'session': session})
+
+def percentile(times, p):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * p))]
+
+def report(name, times):
+    print("{:<12} mean {:.2f} ms, p50 {:.2f} ms, p99 {:.2f} ms".format(
+        name,
+        sum(times) / len(times) * 1000,
+        percentile(times, 0.5) * 1000,
+        percentile(times, 0.99) * 1000))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        addr = sys.argv[1]
+    else:
+        with open('.nrepl-port') as f:
+            addr = 'localhost:' + f.read().strip()
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    client = Client(addr)
+    main = client.clone()
+    code = '(+ 1 2)'
+
+    # warmup
+    for _ in range(50):
+        client.eval(main, code)
+
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        session = client.clone(main)
+        client.eval(session, code)
+        times.append(time.perf_counter() - start)
+        client.close(session)
+    report("clone+eval", times)
+
+    pool = [client.clone(main) for _ in range(iterations)]
+    times = []
+    for session in pool:
+        start = time.perf_counter()
+        client.eval(session, code)
+        times.append(time.perf_counter() - start)
+        client.close(session)
+    report("pooled eval", times)
+
+    client.close(main)
@@ -0,0 +1,141 @@
+#! /usr/bin/env python3
+"""
+Benchmarks cs_printer.format, format_lines and wrap_string on generated
+large REPL values at several widths. Reports time and peak memory,
+checks output against golden snapshots (hashes in bench_printer_golden.json)
+
+    script/bench_printer.py                        # run, check golden
+    script/bench_printer.py --json out.json        # save results
+    script/bench_printer.py --baseline out.json    # compare with saved results
+    script/bench_printer.py --update-golden        # accept current output
+    script/bench_printer.py --scale 4              # 4x bigger corpora
+
+Result format is a list of {"name", "limit", "size", "time_ms", "peak_kb"}.
+Compared with baseline, cases slower by more than --threshold are reported
+and exit code is 1
+"""
+import argparse, hashlib, json, os, random, sys, time, tracemalloc
+
+cwd = os.path.abspath(os.path.dirname(__file__))
+os.chdir(cwd + "/..")
+sys.path.append(os.getcwd())
+import cs_parser, cs_printer
+
+golden_file = cwd + "/bench_printer_golden.json"
+limits = [40, 80, 120]
+
+def nested(depth):
+    return '{:a ' + (nested(depth - 1) if depth else '1') + ' :b [1 2 3]}'
+
+def long_string(rnd, n):
+    return '"' + '\\n'.join(' '.join(rnd.choice(['lorem', 'ipsum', 'dolor', 'sit', 'amet']) for _ in range(rnd.randint(0, 40))) for _ in range(n)) + '"'
+
+def corpora(scale):
+    """
+    Deterministic inputs: name -> text
+    """
+    rnd = random.Random(42)
+    return {
+        'wide vector': '[' + ' '.join(str(i) for i in range(50000 * scale)) + ']',
+        'wide map':    '{' + ' '.join(':key{} "value {}"'.format(i, i) for i in range(10000 * scale)) + '}',
+        'vec of maps': '[' + ' '.join('{{:id {} :name "n{}" :tags #{{:a :b}} :v [1 2 {{:x 3}}]}}'.format(i, i) for i in range(5000 * scale)) + ']',
+        'deep':        nested(200),
+        'strings':     '[' + ' '.join(long_string(rnd, 20) for _ in range(200 * scale)) + ']',
+        'tagged':      '[' + ' '.join('#inst "2024-01-{:02}" #uuid "{:032x}" #my/rec {{:id {} :xs [{}]}}'.format(i % 28 + 1, i, i, ' '.join(map(str, range(i % 30)))) for i in range(3000 * scale)) + ']',
+    }
+
+def timed(fn, repeat):
+    """
+    Best of repeat runs, ms
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def peak_kb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+def run(scale, repeat, memory):
+    results = []
+    golden = {}
+    for name, text in corpora(scale).items():
+        parsed = cs_parser.parse(text)
+        for limit in limits:
+            out = cs_printer.format(text, parsed, limit = limit)
+            golden['{}@{}'.format(name, limit)] = hashlib.sha1(out.encode()).hexdigest()
+            cases = [
+                ('format ' + name, lambda: cs_printer.format(text, parsed, limit = limit)),
+                ('first page ' + name, lambda: list(zip(range(100), cs_printer.format_lines(text, parsed, limit = limit)))),
+            ]
+            if name == 'strings':
+                lines = out.split('\n')
+                cases.append(('wrap_string', lambda: [cs_printer.wrap_string(line, limit = limit // 2, indent = '  ') for line in lines]))
+            for case, fn in cases:
+                result = {'name': case, 'limit': limit, 'size': len(text), 'time_ms': round(timed(fn, repeat), 2)}
+                if memory:
+                    result['peak_kb'] = round(peak_kb(fn))
+                results.append(result)
+                print("{:<24} limit {:>3} {:>6.2f} MB {:>9.1f} ms{}".format(
+                    case, limit, len(text) / 1000000, result['time_ms'],
+                    " {:>9} KB peak".format(result['peak_kb']) if memory else ""))
+    return results, golden
+
+def check_golden(golden, scale, update):
+    key = 'scale {}'.format(scale)
+    saved = {}
+    if os.path.exists(golden_file):
+        with open(golden_file) as f:
+            saved = json.load(f)
+    if update or key not in saved:
+        saved[key] = golden
+        with open(golden_file, 'w') as f:
+            json.dump(saved, f, indent = 2, sort_keys = True)
+        print("Golden snapshots saved for", key)
+        return True
+    failed = [case for case, hash in golden.items() if saved[key].get(case) != hash]
+    for case in failed:
+        print("Golden mismatch:", case)
+    return not failed
+
+def compare(results, baseline_file, threshold):
+    with open(baseline_file) as f:
+        baseline = {(r['name'], r['limit']): r for r in json.load(f)}
+    ok = True
+    for r in results:
+        if (old := baseline.get((r['name'], r['limit']))) and old['time_ms'] > 0:
+            ratio = r['time_ms'] / old['time_ms']
+            slower = ratio > threshold
+            ok = ok and not slower
+            print("{:<24} limit {:>3} {:>9.1f} -> {:>9.1f} ms x{:.2f}{}".format(
+                r['name'], r['limit'], old['time_ms'], r['time_ms'], ratio, "  SLOWER" if slower else ""))
+    return ok
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type = int, default = 1)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--no-memory', action = 'store_true')
+    parser.add_argument('--json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type = float, default = 1.2)
+    parser.add_argument('--update-golden', action = 'store_true')
+    args = parser.parse_args()
+
+    results, golden = run(args.scale, args.repeat, not args.no_memory)
+    ok = check_golden(golden, args.scale, args.update_golden)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent = 2)
+    if args.baseline:
+        ok = compare(results, args.baseline, args.threshold) and ok
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+"""
+Reindent of whole core.clj: per-line indent_at (what indent_lines used to do)
+vs single pass indent_all. Then indent on Enter at different positions:
+parsing everything before point vs enclosing top-level form only.
+Then reindent of a pasted block: whole buffer parse vs enclosing top-level form
+"""
+import gc, os, sys, time
+
+cwd = os.path.abspath(os.path.dirname(__file__))
+os.chdir(cwd + "/..")
+sys.path.append(os.getcwd())
+import cs_parser, cs_reindent, cs_snapshot
+
+if __name__ == '__main__':
+    with open('test_parser/core.clj') as f:
+        text = f.read()
+
+    start = time.time()
+    parsed = cs_parser.parse(text + ' ')
+    print("Parsed {} chars in {:.0f} ms".format(len(text), (time.time() - start) * 1000))
+
+    start = time.time()
+    snapshot = cs_snapshot.Snapshot(text)
+    starts = snapshot.line_starts()
+    per_line = [cs_reindent.indent_at(parsed, point, snapshot.rowcol) for point in starts]
+    print("Per line    {} lines in {:.0f} ms".format(len(starts), (time.time() - start) * 1000))
+
+    start = time.time()
+    snapshot = cs_snapshot.Snapshot(text)
+    starts = snapshot.line_starts()
+    single = cs_reindent.indent_all(parsed, starts, snapshot.rowcol)
+    print("Single pass {} lines in {:.0f} ms".format(len(starts), (time.time() - start) * 1000))
+    assert per_line == single
+
+    start = time.time()
+    replacements = cs_reindent.reindent(snapshot, parsed, starts)
+    print("Reindent    {} lines in {:.0f} ms, {} to change".format(len(starts), (time.time() - start) * 1000, len(replacements)))
+
+    for fraction in [0.1, 0.5, 1.0]:
+        point = snapshot.line_starts()[int((len(starts) - 1) * fraction)] - 1
+        start = time.time()
+        parsed = cs_parser.parse(text[:point] + ' ')
+        expected = cs_reindent.indent_at(parsed, point, snapshot.rowcol)
+        prefix = time.time() - start
+        del parsed
+        gc.collect()
+        start = time.time()
+        form_start, _, parsed = cs_reindent.top_level_context(lambda begin, end: text[begin:end], point, cs_parser.parse)
+        actual = cs_reindent.indent_at(parsed, point - form_start, lambda p: snapshot.rowcol(form_start + p))
+        local = time.time() - start
+        assert expected == actual
+        print("Enter at {:>3.0f}%: prefix {:>6.1f} ms, top-level form {:>5.1f} ms".format(fraction * 100, prefix * 1000, local * 1000))
+
+    # paste a few top-level forms, unindented, in the middle of the file
+    block = '\n'.join(line.lstrip() for line in text[starts[1000]:starts[1200]].split('\n'))
+    point = starts[4000]
+    pasted = text[:point] + block + text[point:]
+    begin, end = point, point + len(block)
+
+    gc.collect()
+    start = time.time()
+    snapshot = cs_snapshot.Snapshot(pasted)
+    parsed = cs_parser.parse(pasted + ' ')
+    expected = cs_reindent.reindent(snapshot, parsed, snapshot.line_begins(begin, end))
+    whole = time.time() - start
+    del parsed
+    gc.collect()
+
+    start = time.time()
+    form_start, _, _ = cs_reindent.top_level_context(lambda b, e: pasted[b:e], begin, cs_parser.parse)
+    local_text = pasted[form_start:pasted.find('\n', end)]
+    local = cs_snapshot.Snapshot(local_text)
+    parsed = cs_parser.parse(local_text + ' ')
+    actual = cs_reindent.reindent(local, parsed, local.line_begins(begin - form_start, end - form_start))
+    local_time = time.time() - start
+    assert sorted(expected.values()) == sorted((b + form_start, d) for b, d in actual.values())
+    print("Paste {} lines: whole buffer {:>6.1f} ms, top-level form {:>5.1f} ms".format(block.count('\n') + 1, whole * 1000, local_time * 1000))
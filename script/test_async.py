@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+import asyncio, os, socket, sys, threading, time
+
+cwd = os.path.dirname(__file__)
+os.chdir(os.path.abspath(cwd + "/.."))
+sys.path.append(os.getcwd())
+import cs_async, cs_bencode
+
+def collect(agen_fn, chunks):
+    """
+    Feeds chunks into asyncio.StreamReader one by one, returns everything agen_fn(reader) yielded
+    """
+    async def run():
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        return [x async for x in agen_fn(reader)]
+    return asyncio.run(run())
+
+def test_lines():
+    assert collect(cs_async.lines, [b'ab', b'c\nde', b'\n\nf']) == ['abc', 'de', '', 'f']
+    assert collect(cs_async.lines, [b'abc\n']) == ['abc']
+    assert collect(cs_async.lines, []) == []
+    assert collect(cs_async.lines, ['𝕏\n'.encode()[:2], '𝕏\n'.encode()[2:]]) == ['𝕏']
+
+def test_decode_stream():
+    msgs = [{'id': 1, 'op': 'eval', 'code': '(+ 1 2)'}, {'status': ['done'], 'value': 'тест'}]
+    data = ''.join(cs_bencode.encode(msg) for msg in msgs).encode()
+    assert collect(cs_bencode.decode_stream, [data]) == msgs
+    # split at every byte
+    assert collect(cs_bencode.decode_stream, [data[i:i+1] for i in range(len(data))]) == msgs
+
+def test_stop():
+    """
+    Stopping loop closes transports and cancels read loops. Closing transport
+    after that returns immediately and doesn’t start the loop again
+    """
+    server = socket.socket()
+    server.bind(('localhost', 0))
+    server.listen()
+    port = server.getsockname()[1]
+    conns = []
+    threading.Thread(daemon = True, target = lambda: conns.append(server.accept())).start()
+
+    loop = cs_async.Loop()
+    cs_async.loop, old_loop = loop, cs_async.loop
+    try:
+        transport = cs_async.Transport(f'localhost:{port}')
+        async def read_loop(reader):
+            await reader.read()
+        transport.start(read_loop)
+        thread = loop.thread
+        loop.stop()
+        assert not thread.is_alive()
+        assert transport.task.cancelled() or transport.task.done()
+        assert transport.writer.is_closing()
+
+        start = time.time()
+        transport.close()
+        assert time.time() - start < 0.1, time.time() - start
+        assert loop.loop is None and loop.thread is None
+        assert not loop.call(print)
+        try:
+            loop.run(asyncio.sleep(0))
+            assert False, 'Expected RuntimeError'
+        except RuntimeError:
+            pass
+    finally:
+        cs_async.loop = old_loop
+        server.close()
+
+if __name__ == '__main__':
+    test_lines()
+    test_decode_stream()
+    test_stop()
+    print("Async tests: OK")
@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+import os, random, sys
+
+cwd = os.path.dirname(__file__)
+os.chdir(os.path.abspath(cwd + "/.."))
+sys.path.append(os.getcwd())
+import cs_intervals
+
+def touch(a, b):
+    return not a[1] < b[0] and not a[0] > b[1]
+
+def test_random():
+    """
+    Compares IntervalIndex against brute force on random intervals and edits
+    """
+    tests = 0
+    failed = 0
+    for i in range(0, 1000):
+        index = cs_intervals.IntervalIndex()
+        intervals = {}
+        for key in range(random.randint(0, 50)):
+            begin = random.randint(0, 1000)
+            end = begin + random.randint(0, 30)
+            index.set(key, begin, end)
+            intervals[key] = (begin, end)
+        for _ in range(20):
+            tests += 1
+            op = random.choice(['query', 'replace', 'remove', 'set'])
+            begin = random.randint(0, 1000)
+            end = begin + random.randint(0, 30)
+            if op == 'query':
+                expected = sorted(k for k, v in intervals.items() if touch(v, (begin, end)))
+                actual = sorted(index.query(begin, end))
+            elif op == 'replace':
+                length = random.randint(0, 30)
+                expected = sorted(k for k, v in intervals.items() if touch(v, (begin, end)))
+                actual = sorted(index.replace(begin, end, length))
+                delta = length - (end - begin)
+                intervals = {k: (v[0] + delta, v[1] + delta) if v[0] > end else v \
+                             for k, v in intervals.items() if k not in expected}
+            elif op == 'remove' and intervals:
+                key = random.choice(list(intervals.keys()))
+                index.remove(key)
+                del intervals[key]
+                expected = None
+                actual = index.get(key)
+            else:
+                key = random.randint(0, 60)
+                index.set(key, begin, end)
+                intervals[key] = (begin, end)
+                expected = (begin, end)
+                actual = index.get(key)
+            consistent = index.begins == sorted(index.begins) \
+                and sorted(index.keys) == sorted(intervals.keys()) \
+                and all(index.get(k) == v for k, v in intervals.items())
+            if actual != expected or not consistent:
+                failed += 1
+                if failed == 1:
+                    print("FAIL", op, begin, end, "expected", expected, "actual", actual)
+    print("Interval index tests: {}, failed: {}\n".format(tests, failed), flush=True)
+
+if __name__ == '__main__':
+    test_random()
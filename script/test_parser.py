@@ -53,7 +53,29 @@ def test_random():
                 test_core.print_table(["Expr", "Expected", "Actual"], [expr, "(source 0..{})".format(len(expr)), actual])
     print("Randomized tests: {}, failed: {}\n".format(tests, failed), flush=True)
 
+def test_changed_forms():
+    def keys(text, loaded = {}):
+        parsed = cs_parser.parse(text)
+        return [cs_parser.form_key(form, text) for form in cs_parser.changed_forms(parsed, text, loaded)]
+    before = "(ns a.b)\n(defn foo [] 1)\n;; c\n#_(x)\n(def ^:private bar 2)\n:kw\n(defmethod m :a [_] 3)"
+    assert keys(before) == ['ns a.b', 'defn foo', 'def bar', ':kw', 'defmethod m :a'], keys(before)
+    parsed = cs_parser.parse(before)
+    loaded = {cs_parser.form_key(form, before): hash(before[form.start:form.end]) for form in cs_parser.top_level_forms(parsed)}
+    after = before.replace("(defn foo [] 1)", "(defn foo [] 10)") + "\n(defn baz [])"
+    assert keys(after, loaded) == ['defn foo', 'defn baz'], keys(after, loaded)
+
+def test_defined_namespace():
+    text = "(ns ^:no-doc a.b)\n(in-ns 'c.d)\n(in-ns x)\n(def e 1)"
+    parsed = cs_parser.parse(text)
+    actual = [cs_parser.defined_namespace(form) for form in parsed.children if form.name != 'whitespace']
+    assert actual == ['a.b', 'c.d', None, None], actual
+    namespaces = cs_parser.namespaces(parsed)
+    actual = [namespaces[form.start] for form in parsed.children if form.name != 'whitespace']
+    assert actual == [None, 'a.b', 'c.d', 'c.d'], actual
+
 if __name__ == '__main__':
+    test_changed_forms()
+    test_defined_namespace()
     test_parse_trees()
     test_clojure()
     test_random()
@@ -14,5 +14,13 @@ def test_printer():
         return cs_printer.format(input, node)
     test_core.run_tests(dir, test_fn, col_input = False)
 
+def test_printer_lines():
+    dir = cwd + "/../test_printer/"
+    def test_fn(input):
+        node = cs_parser.parse(input)
+        return "\n".join(cs_printer.format_lines(input, node))
+    test_core.run_tests(dir, test_fn, col_input = False)
+
 if __name__ == '__main__':
     test_printer()
+    test_printer_lines()
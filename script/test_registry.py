@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+import os, queue, random, sys, threading
+
+cwd = os.path.dirname(__file__)
+os.chdir(os.path.abspath(cwd + "/.."))
+sys.path.append(os.getcwd())
+import cs_registry
+
+class FakeView:
+    def __init__(self, id):
+        self._id = id
+
+    def id(self):
+        return self._id
+
+class FakeEval:
+    def __init__(self, id, view):
+        self.id = id
+        self.view = view
+        self.status = random.choice(['pending', 'success', 'exception'])
+
+def test_stress(writers = 8, readers = 4, ops = 300):
+    """
+    Hammers registry from many threads. Owner thread applies posted mutations,
+    like Sublime’s UI thread does with sublime.set_timeout
+    """
+    tasks = queue.Queue()
+    stop = object()
+    owner = threading.Thread(target = lambda: [fn() for fn in iter(tasks.get, stop)])
+    registry = cs_registry.Registry(post = tasks.put, owner = owner)
+    owner.start()
+    views = [FakeView(i) for i in range(4)]
+    errors = []
+    done = threading.Event()
+
+    def write(n):
+        try:
+            for i in range(ops):
+                id = f'{n}.{i}'
+                view = random.choice(views)
+                registry.add(id, view.id(), FakeEval(id, view))
+                if i > 0 and random.random() < 0.7:
+                    prev = f'{n}.{random.randint(0, i - 1)}'
+                    # removing twice or removing missing is fine
+                    registry.remove(prev, views[0].id())
+                    for view in views:
+                        registry.remove(prev, view.id())
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            while not done.is_set():
+                for view in views:
+                    for eval in registry.values_in_view(view.id()):
+                        assert eval.view is view
+                        eval.status == 'pending'
+                for eval in registry.values():
+                    registry.get(eval.id)
+                    registry.get_in_view(eval.view.id(), eval.id)
+        except Exception as e:
+            errors.append(e)
+
+    ws = [threading.Thread(target = write, args = (n, )) for n in range(writers)]
+    rs = [threading.Thread(target = read) for _ in range(readers)]
+    for t in ws + rs:
+        t.start()
+    for t in ws:
+        t.join()
+    done.set()
+    for t in rs:
+        t.join()
+    tasks.put(stop)
+    owner.join()
+
+    by_view = {id: eval for view in views for id, eval in ((e.id, e) for e in registry.values_in_view(view.id()))}
+    consistent = by_view == registry.by_id and all(eval.view.id() == view_id for view_id, es in registry.by_view.items() for eval in es.values())
+    failed = 1 if errors or not consistent else 0
+    if errors:
+        print("Errors:", errors[:3])
+    if not consistent:
+        print("Inconsistent: {} by id, {} by view".format(len(registry.by_id), len(by_view)))
+    print("Registry stress test: {} evals left, failed: {}\n".format(len(registry.by_id), failed), flush=True)
+
+if __name__ == '__main__':
+    test_stress()
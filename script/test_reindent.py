@@ -0,0 +1,116 @@
+#! /usr/bin/env python3
+import os, random, sys
+
+cwd = os.path.dirname(__file__)
+os.chdir(os.path.abspath(cwd + "/.."))
+sys.path.append(os.getcwd())
+import cs_parser, cs_reindent, cs_snapshot
+
+def corpus():
+    for dir in ['test_parser', 'test_repl']:
+        for file in sorted(os.listdir(dir)):
+            if file.endswith(('.clj', '.cljc')):
+                with open(dir + '/' + file) as f:
+                    yield file, f.read()
+
+def mutate(rnd, text):
+    """
+    Deletes or duplicates a few random chars, to get unbalanced parens and unclosed strings
+    """
+    for _ in range(rnd.randint(1, 5)):
+        i = rnd.randrange(len(text))
+        if rnd.random() < 0.5:
+            text = text[:i] + text[i + 1:]
+        else:
+            text = text[:i] + text[i] + text[i:]
+    return text
+
+def check(name, text):
+    """
+    Single pass must give the same indents as indent_at called per line
+    """
+    parsed = cs_parser.parse(text + ' ')
+    snapshot = cs_snapshot.Snapshot(text)
+    starts = snapshot.line_starts()
+    expected = [cs_reindent.indent_at(parsed, point, snapshot.rowcol) for point in starts]
+    actual = cs_reindent.indent_all(parsed, starts, snapshot.rowcol)
+    for point, e, a in zip(starts, expected, actual):
+        if e != a:
+            print("FAIL {} at {}: expected {}, got {}".format(name, snapshot.rowcol(point), e, a))
+            return False
+    return True
+
+def test_reindent():
+    tests, failed = 0, 0
+    rnd = random.Random(42)
+    for name, text in corpus():
+        small = text[:20000]
+        for variant, input in [(name, text)] + [(name + ' mutated', mutate(rnd, small)) for _ in range(20)]:
+            tests += 1
+            if not check(variant, input):
+                failed += 1
+    print("Tests: {}, failed: {}".format(tests, failed))
+
+def check_local_context(name, text, point, snapshot):
+    parsed = cs_parser.parse(text[:point] + ' ')
+    expected = cs_reindent.indent_at(parsed, point, snapshot.rowcol)
+    start, _, parsed = cs_reindent.top_level_context(lambda begin, end: text[begin:end], point, cs_parser.parse, chunk = 16)
+    actual = cs_reindent.indent_at(parsed, point - start, lambda p: snapshot.rowcol(start + p))
+    if expected != actual:
+        print("FAIL {} at {}: expected {}, got {}".format(name, snapshot.rowcol(point), expected, actual))
+        return False
+    return True
+
+def test_local_context():
+    """
+    Indent computed from enclosing top-level form only must match indent
+    computed from everything before point (what Enter used to do)
+    """
+    tests, failed = 0, 0
+    rnd = random.Random(42)
+    # blank line + open paren inside a docstring is not a top-level form
+    docstring = "(defn foo\n  \"Usage:\n\n(foo 1)\"\n  [x]\n  (let [y 1]\n    (+ x"
+    # same inside a form that doesn’t start at column 0
+    nested = "(comment\n  (a\n\n(b 1))\n  (c\n    d"
+    cases = [('docstring', docstring, [len(docstring)]), ('nested', nested, [len(nested)])]
+    for name, text in corpus():
+        cases.append((name, text, rnd.sample(range(1, len(text)), min(30, len(text) - 1))))
+    for name, text, points in cases:
+        snapshot = cs_snapshot.Snapshot(text)
+        for point in points:
+            tests += 1
+            if not check_local_context(name, text, point, snapshot):
+                failed += 1
+    print("Local context tests: {}, failed: {}".format(tests, failed))
+
+def test_inserted_ranges():
+    # "ab|cd|ef" -> paste "XY" at both -> "abXYcdXYef"
+    assert cs_reindent.inserted_ranges([(2, 2, 2), (6, 6, 2)]) == [(2, 4), (6, 8)]
+    # same, but changes applied bottom-up
+    assert cs_reindent.inserted_ranges([(4, 4, 2), (2, 2, 2)]) == [(2, 4), (6, 8)]
+    # "a[bc]d[e]f" -> paste "123" over selections -> "a123d123f"
+    assert cs_reindent.inserted_ranges([(1, 3, 3), (5, 6, 3)]) == [(1, 4), (5, 8)]
+    # whole-line paste: "x\n(a|)\n" -> "x\nfoo\n(a)\n", inserted above current line, cursor stays in (a)
+    assert cs_reindent.inserted_ranges([(2, 2, 4)]) == [(2, 6)]
+    # deletion only
+    assert cs_reindent.inserted_ranges([(2, 5, 0)]) == []
+
+def test_snapshot():
+    snapshot = cs_snapshot.Snapshot("a\n\nbc\nd")
+    assert snapshot.line_starts() == [0, 2, 3, 6], snapshot.line_starts()
+    assert [snapshot.rowcol(p) for p in range(snapshot.size() + 1)] == \
+        [(0, 0), (0, 1), (1, 0), (2, 0), (2, 1), (2, 2), (3, 0), (3, 1)]
+    assert [snapshot.line(p) for p in range(snapshot.size() + 1)] == \
+        [(0, 1), (0, 1), (2, 2), (3, 5), (3, 5), (3, 5), (6, 7), (6, 7)]
+    assert snapshot.line_begins(0, 0) == [0]
+    assert snapshot.line_begins(1, 3) == [0, 2, 3]
+    assert snapshot.line_begins(3, 7) == [3, 6]
+    snapshot = cs_snapshot.Snapshot("(𝕏 é\n 𝕏)")
+    assert snapshot.rowcol_utf16(4) == (0, 5), snapshot.rowcol_utf16(4)
+    assert snapshot.rowcol_utf16(7) == (1, 3), snapshot.rowcol_utf16(7)
+
+if __name__ == '__main__':
+    test_snapshot()
+    test_inserted_ranges()
+    test_reindent()
+    test_local_context()
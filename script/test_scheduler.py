@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+import os, sys
+
+cwd = os.path.dirname(__file__)
+os.chdir(os.path.abspath(cwd + "/.."))
+sys.path.append(os.getcwd())
+import cs_scheduler
+
+class Harness:
+    """
+    Scheduler with `limit` slots. Sent ids are recorded, erased ids are dropped
+    """
+    def __init__(self, limit):
+        self.sent = []
+        self.dropped = []
+        self.erased = set()
+        self.on_finished = {} # id -> fn, called on done or drop
+        self.scheduler = cs_scheduler.Scheduler(
+            limit = lambda: limit,
+            alive = lambda id: id not in self.erased,
+            start = lambda id, send: send(),
+            drop  = self.drop)
+
+    def drop(self, id):
+        self.dropped.append(id)
+        if fn := self.on_finished.pop(id, None):
+            fn()
+
+    def schedule(self, id, priority = 0):
+        self.scheduler.push(id, lambda: self.sent.append(id), priority)
+        self.scheduler.dispatch()
+
+    def done(self, id):
+        assert self.scheduler.done(id)
+        self.scheduler.dispatch()
+        if fn := self.on_finished.pop(id, None):
+            fn()
+
+    def sequence(self, ids, priority = 1):
+        """
+        Schedules ids one after another, like BufferEval does
+        """
+        def next(i):
+            if i < len(ids):
+                self.on_finished[ids[i]] = lambda: next(i + 1)
+                self.schedule(ids[i], priority)
+        next(0)
+
+def test_order():
+    h = Harness(limit = 1)
+    h.schedule('a')
+    h.schedule('bulk1', priority = 1)
+    h.schedule('bulk2', priority = 1)
+    h.schedule('b')
+    h.schedule('c')
+    assert h.sent == ['a']
+    for id in ['a', 'b', 'c', 'bulk1', 'bulk2']:
+        h.done(id)
+    assert h.sent == ['a', 'b', 'c', 'bulk1', 'bulk2']
+    assert not h.scheduler.done('a')
+
+def test_unlimited():
+    h = Harness(limit = 0)
+    for id in ['a', 'b', 'c']:
+        h.schedule(id)
+    assert h.sent == ['a', 'b', 'c']
+
+def test_drop_erased():
+    """
+    Form erased while in queue doesn’t stall the sequence it belongs to
+    """
+    h = Harness(limit = 1)
+    h.schedule('interactive')
+    h.sequence(['form1', 'form2', 'form3'])
+    assert h.sent == ['interactive']
+    h.erased.add('form1')
+    h.done('interactive')
+    assert h.dropped == ['form1']
+    assert h.sent == ['interactive', 'form2']
+    h.done('form2')
+    h.done('form3')
+    assert h.sent == ['interactive', 'form2', 'form3']
+    assert not h.on_finished
+    assert not h.scheduler.queue and not h.scheduler.in_flight
+
+def test_drop_all():
+    h = Harness(limit = 1)
+    h.schedule('interactive')
+    h.sequence(['form1', 'form2', 'form3'])
+    h.erased.update(['form1', 'form2', 'form3'])
+    h.done('interactive')
+    assert h.dropped == ['form1', 'form2', 'form3']
+    assert h.sent == ['interactive']
+    assert not h.on_finished
+
+if __name__ == '__main__':
+    test_order()
+    test_unlimited()
+    test_drop_erased()
+    test_drop_all()
+    print("Scheduler tests: OK")
@@ -4,7 +4,8 @@
     [clojure.string :as str])
   (:import
     [clojure.lang Compiler Compiler$CompilerException ExceptionInfo LispReader$ReaderException]
-    [java.io BufferedWriter OutputStream OutputStreamWriter PrintWriter Writer]))
+    [java.io BufferedWriter OutputStream OutputStreamWriter PrintWriter Writer]
+    [java.lang.management GarbageCollectorMXBean ManagementFactory]))
 
 (def ^:dynamic *print-quota*
   1024)
@@ -200,3 +201,189 @@
   (let [[vars _] (reset-vals! *changed-vars {})]
     (doseq [[var val] vars]
       (.set ^clojure.lang.Var var val))))
+
+;; Allocation and GC accounting
+
+(def thread-allocated-bytes
+  "Fn returning bytes allocated by current thread so far, or nil if JVM
+   doesn’t support it (com.sun.management is not available everywhere)"
+  (try
+    (eval
+      '(let [bean (java.lang.management.ManagementFactory/getThreadMXBean)]
+         (when (and
+                 (instance? com.sun.management.ThreadMXBean bean)
+                 (.isThreadAllocatedMemorySupported ^com.sun.management.ThreadMXBean bean))
+           (.setThreadAllocatedMemoryEnabled ^com.sun.management.ThreadMXBean bean true)
+           (fn []
+             (.getThreadAllocatedBytes ^com.sun.management.ThreadMXBean bean (.getId (Thread/currentThread)))))))
+    (catch Throwable _
+      nil)))
+
+(defn resources
+  "Bytes allocated by current thread, GC count and time (ms) across whole JVM"
+  []
+  (let [gcs (ManagementFactory/getGarbageCollectorMXBeans)]
+    {:alloc    (when thread-allocated-bytes
+                 (thread-allocated-bytes))
+     :gc-count (transduce (map #(max 0 (.getCollectionCount ^GarbageCollectorMXBean %))) + 0 gcs)
+     :gc-time  (transduce (map #(max 0 (.getCollectionTime ^GarbageCollectorMXBean %))) + 0 gcs)}))
+
+(defn resources-since
+  "What happened since `(resources)` returned `before`, as a map with
+   \"alloc\" (bytes, if supported), \"gc_count\" and \"gc_time\" (ms)"
+  [before]
+  (let [after (resources)]
+    (cond->
+      {"gc_count" (- (:gc-count after) (:gc-count before))
+       "gc_time"  (- (:gc-time after) (:gc-time before))}
+      (:alloc before)
+      (assoc "alloc" (- (:alloc after) (:alloc before))))))
+
+;; Benchmarking
+
+;; Summary `text` is printed as is, without quotes, so it reads well inline.
+;; Optional `details` are sent separately, not subject to *print-quota*
+(deftype Report [^String text ^String details]
+  Object
+  (toString [_]
+    text))
+
+(defmethod print-method Report [x ^Writer w]
+  (.write w (str x)))
+
+(defn report-details [x]
+  (when (instance? Report x)
+    (.-details ^Report x)))
+
+(defn format-duration [ns]
+  (let [ns (double ns)]
+    (cond
+      (< ns 1e3) (format "%.1f ns" ns)
+      (< ns 1e6) (format "%.2f µs" (/ ns 1e3))
+      (< ns 1e9) (format "%.2f ms" (/ ns 1e6))
+      :else      (format "%.2f sec" (/ ns 1e9)))))
+
+(defn- percentile ^double [^doubles sorted p]
+  (aget sorted (min (dec (alength sorted)) (long (* p (alength sorted))))))
+
+(defn- check-interrupted []
+  (when (Thread/interrupted)
+    (throw (InterruptedException.))))
+
+(defn benchmark
+  "Calls `f` repeatedly and reports time per call. Warms up for `warmup-ms`,
+   then uses warmup speed to pick how many calls go into one sample (so that
+   it takes ~`sample-ms`) and how many samples fit into `time-ms`. Mean is
+   computed without outliers (outside of 1.5 IQR), p50/p99 over all samples"
+  ([f]
+   (benchmark f nil))
+  ([f {:keys [warmup-ms sample-ms time-ms min-samples max-samples]
+       :or   {warmup-ms 1000, sample-ms 10, time-ms 5000, min-samples 10, max-samples 1000}}]
+   (let [warmup-start (System/nanoTime)
+         warmup-end   (+ warmup-start (* warmup-ms 1000000))
+         warmup-calls (loop [n 1]
+                        (f)
+                        (check-interrupted)
+                        (if (< (System/nanoTime) warmup-end)
+                          (recur (inc n))
+                          n))
+         per-call     (/ (double (- (System/nanoTime) warmup-start)) warmup-calls)
+         batch        (max 1 (long (/ (* sample-ms 1e6) per-call)))
+         samples      (-> (long (/ (* time-ms 1e6) (* batch per-call)))
+                        (min max-samples)
+                        (max min-samples))
+         times        (double-array samples)]
+     (dotimes [i samples]
+       (let [start (System/nanoTime)]
+         (dotimes [_ batch]
+           (f))
+         (aset times i (/ (double (- (System/nanoTime) start)) batch)))
+       (check-interrupted))
+     (java.util.Arrays/sort times)
+     (let [q1   (percentile times 0.25)
+           q3   (percentile times 0.75)
+           lo   (- q1 (* 1.5 (- q3 q1)))
+           hi   (+ q3 (* 1.5 (- q3 q1)))
+           kept (double-array (filter #(<= lo % hi) times))
+           mean (/ (areduce kept i sum 0.0 (+ sum (aget kept i))) (alength kept))]
+       (Report.
+         (format "mean %s, p50 %s, p99 %s, %,.0f calls/s (%d samples × %d calls, %d outliers)"
+           (format-duration mean)
+           (format-duration (percentile times 0.5))
+           (format-duration (percentile times 0.99))
+           (/ 1e9 mean)
+           samples
+           batch
+           (- samples (alength kept)))
+         nil)))))
+
+;; Profiling
+
+(defn- profile-frame? [^StackTraceElement el]
+  (.startsWith (.getClassName el) "clojure_sublimed.core$profile"))
+
+(defn- frame-str [^StackTraceElement el]
+  (let [{:keys [method file line]} (trace-element el)]
+    (str method " (" file ":" line ")")))
+
+(defn profile
+  "Calls `f` while a background thread samples its stack every `interval-ms`
+   (wall clock: waiting counts too). Returns Report with number of samples and
+   the hottest frame, details are `top` frames by self samples and all stacks
+   in collapsed format (root;...;leaf count, for flamegraph.pl or speedscope)"
+  ([f]
+   (profile f nil))
+  ([f {:keys [interval-ms top]
+       :or   {interval-ms 1, top 20}}]
+   (let [thread  (Thread/currentThread)
+         running (java.util.concurrent.atomic.AtomicBoolean. true)
+         samples (volatile! {}) ;; only touched by sampler until it’s joined
+         sampler (doto (Thread.
+                         ^Runnable
+                         (fn []
+                           (while (.get running)
+                             (let [trace (.getStackTrace thread)]
+                               (when (pos? (alength trace))
+                                 (vswap! samples update (vec trace) (fnil inc 0))))
+                             (Thread/sleep (long interval-ms))))
+                         "clojure-sublimed-profiler")
+                   (.setDaemon true)
+                   (.start))
+         start   (System/nanoTime)
+         _       (try
+                   (f)
+                   (finally
+                     (.set running false)
+                     (.join sampler)))
+         elapsed (- (System/nanoTime) start)
+         stacks  (for [[trace n] @samples
+                       :let [frames (->> trace
+                                      (take-while #(not (profile-frame? %)))
+                                      (remove #(#{"clojure.lang.RestFn" "clojure.lang.AFn"} (.getClassName ^StackTraceElement %)))
+                                      (clear-duplicates)
+                                      (vec))]
+                       :when (seq frames)]
+                   [frames n]) ;; frames are leaf first
+         total   (transduce (map second) + 0 stacks)
+         self    (reduce
+                   (fn [m [frames n]]
+                     (update m (frame-str (first frames)) (fnil + 0) n))
+                   {} stacks)
+         hottest (take top (sort-by (comp - val) self))]
+     (if (zero? total)
+       (Report. (str "No samples, finished in " (format-duration elapsed)) nil)
+       (Report.
+         (format "%d samples in %s, hottest %s (%.0f%%)"
+           total
+           (format-duration elapsed)
+           (key (first hottest))
+           (* 100.0 (/ (val (first hottest)) total)))
+         (str
+           "Self samples:\n"
+           (str/join "\n"
+             (for [[frame n] hottest]
+               (format "%5.1f%% %6d  %s" (* 100.0 (/ n total)) n frame)))
+           "\n\nCollapsed stacks:\n"
+           (str/join "\n"
+             (for [[frames n] (sort-by (comp - second) stacks)]
+               (str (str/join ";" (map #(:method (trace-element %)) (rseq frames))) " " n)))))))))
@@ -87,12 +87,35 @@
    :handles {}})
 
 
+;; extra response keys for the value, set by eval-with-extra on eval thread,
+;; read on the same thread when value is sent
+(def ^ThreadLocal eval-extra
+  (ThreadLocal.))
+
+(defn eval-with-extra [form]
+  (let [before (core/resources)
+        ret    (try
+                 (eval form)
+                 (finally
+                   (.set eval-extra (core/resources-since before))))]
+    (when-some [details (core/report-details ret)]
+      (.set eval-extra (assoc (.get eval-extra) "details" details)))
+    ret))
+
+(defn- assoc-extra [resp]
+  (if-some [extra (.get eval-extra)]
+    (do
+      (.remove eval-extra)
+      (reduce-kv #(assoc %1 (keyword "clojure-sublimed.middleware" %2) %3) resp extra))
+    resp))
+
 (defn time-eval [handler]
   (fn [{:keys [op] :as msg}]
     (if (= "eval" op)
       (let [start (System/nanoTime)]
         (-> msg
-          (on-send #(cond-> % (contains? % :value) (assoc ::time-taken (- (System/nanoTime) start))))
+          (cond-> (nil? (:eval msg)) (assoc :eval (str `eval-with-extra)))
+          (on-send #(cond-> % (contains? % :value) (-> (assoc ::time-taken (- (System/nanoTime) start)) (assoc-extra))))
           (handler)))
       (handler msg))))
 
@@ -115,12 +115,18 @@
                          "to_line"     (.get Compiler/LINE_AFTER)
                          "to_column"   (.get Compiler/COLUMN_AFTER)
                          "form"        obj-str)
-                       (let [start (System/nanoTime)
-                             ret   (Compiler/eval obj false)]
+                       (let [start  (System/nanoTime)
+                             before (core/resources)
+                             ret    (Compiler/eval obj false)
+                             time   (-> (System/nanoTime) (- start) (quot 1000000))]
                          (*out-fn*
-                           {"tag"  "ret"
-                            "val"  (core/bounded-pr-str ret)
-                            "time" (-> (System/nanoTime) (- start) (quot 1000000))})
+                           (merge
+                             {"tag"  "ret"
+                              "val"  (core/bounded-pr-str ret)
+                              "time" time}
+                             (core/resources-since before)
+                             (when-some [details (core/report-details ret)]
+                               {"details" details})))
                          (consume-ws reader)
                          (.set Compiler/LINE_BEFORE (.getLineNumber reader))
                          (.set Compiler/COLUMN_BEFORE (.getColumnNumber reader))